@@ -0,0 +1,82 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from static import Static
+import json
+import os
+import tempfile
+import threading
+
+
+class ApplyCache(object):
+    # per cluster record of what was last applied successfully, as a hash of
+    # the rendered manifest for every element. elements whose rendered
+    # output hasn't changed since can skip kubectl apply.
+
+    lock = threading.Lock()
+
+    def __init__(self, settings):
+        self.settings = settings
+        folder = os.path.join(self.settings.folder_user_cache, "applied")
+        if not os.path.exists(folder):
+            self.settings.mkdir_p(folder)
+        self.path = os.path.join(folder, "{0}.json".format(self.settings.cluster.name))
+        self.applied = self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except ValueError:
+            # torn or hand edited, start over
+            Static.msg("Ignoring unreadable apply cache", self.path)
+            return {}
+
+    def unchanged(self, name, digest):
+        return self.applied.get(name) == digest
+
+    def store(self, name, digest):
+        with ApplyCache.lock:
+            self.applied[name] = digest
+            self.save()
+
+    def forget(self, name):
+        with ApplyCache.lock:
+            if self.applied.pop(name, None) is not None:
+                self.save()
+
+    def clear(self):
+        with ApplyCache.lock:
+            self.applied = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def save(self):
+        # write and rename, so an interrupted run never leaves half a file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".applied-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.applied, f, indent=1, sort_keys=True)
+        os.rename(tmp, self.path)
@@ -23,147 +23,341 @@ SOFTWARE.
 """
 
 from static import Static
+from executor import Executor
+from retry import Retry
+from tracer import Tracer
+from replay import Replay
+from log import Log
 import subprocess
+import collections
+import threading
+import errno
 import os
+import signal
 import sys
 import time
 import getpass
 
 
+class CmdFailed(Exception):
+
+    def __init__(self, name, cmd, returncode, out, err):
+        Exception.__init__(self, name)
+        self.name = name
+        self.cmd = cmd
+        self.returncode = returncode
+        self.out = out
+        self.err = err
+
+
+class CmdResult(object):
+    returncode = None
+    out = None
+    err = None
+    # bytes seen on stdout and stderr, even when only the tail is kept
+    nbytes = 0
+    # peak resident set of the child in kilobytes, None if unknown
+    maxrss = None
+    # killed after running longer than its timeout
+    timed_out = False
+
+    def __init__(self, returncode, out, err, nbytes=0, maxrss=None, timed_out=False):
+        self.returncode = returncode
+        self.out = out
+        self.err = err
+        self.nbytes = nbytes
+        self.maxrss = maxrss
+        self.timed_out = timed_out
+
+
 class Cmd(object):
 
+    # lines of output kept for the failure message, the rest is dropped
+    stderr_tail_lines = 200
+    # longest single line read at once, longer lines are split
+    stream_line_limit = 65536
+
     @staticmethod
-    def local_run_realtime(name, cmd):
-        proc1 = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+    def execute(name, cmd, stream=False, setsid=True, stdin=None, timeout=None):
+        # every command goes through here. cmd is a shell string or an argv
+        # list (no shell). with stream=True stdout is echoed live and only
+        # its tail is kept, otherwise the full stdout is returned. stdin is
+        # bytes to feed the child, None leaves the terminal attached. after
+        # timeout seconds the child (and its process group) is terminated.
+        span = Tracer.begin()
+        if Replay.replaying():
+            returncode, out, err = Replay.serve(name, cmd)
+            if stream:
+                Log.output(out, name)
+            result = CmdResult(returncode, out, err, len(out) + len(err))
+            Tracer.end(span, name, cmd, result)
+            return result
+
+        started = time.time()
+        try:
+            proc1 = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                     stdin=subprocess.PIPE if stdin is not None else None,
+                                     shell=not isinstance(cmd, list),
+                                     preexec_fn=os.setsid if setsid else None)
+        except OSError as e:
+            result = CmdResult(127, '', "{0}: {1}\n".format(cmd[0], e.strerror))
+            if Replay.recording():
+                Replay.record(name, cmd, result.returncode, result.out, result.err, time.time() - started)
+            Tracer.end(span, name, cmd, result)
+            return result
+
+        # stderr is drained on its own thread so neither pipe can fill up
+        # and block the child. only tails are kept when streaming, memory
+        # stays flat on multi-hour kops runs.
+        if stream and not Replay.recording():
+            out_lines = collections.deque(maxlen=Cmd.stderr_tail_lines)
+        else:
+            out_lines = []
+        err_tail = collections.deque(maxlen=Cmd.stderr_tail_lines)
+        counted = [0, 0]
+
+        def drain_stderr():
+            for line in iter(lambda: proc1.stderr.readline(Cmd.stream_line_limit), ''):
+                counted[1] += len(line)
+                err_tail.append(line)
+
+        reader = threading.Thread(target=drain_stderr)
+        reader.daemon = True
+        reader.start()
+
+        timed_out = []
+        timer = None
+        if timeout is not None:
+            def expire():
+                timed_out.append(True)
+                try:
+                    if setsid:
+                        os.killpg(proc1.pid, signal.SIGTERM)
+                    else:
+                        proc1.terminate()
+                except OSError:
+                    pass
+
+            timer = threading.Timer(timeout, expire)
+            timer.daemon = True
+            timer.start()
+
+        feeder = None
+        if stdin is not None:
+            def feed_stdin():
+                try:
+                    proc1.stdin.write(stdin)
+                    proc1.stdin.close()
+                except IOError as e:
+                    # the child exited without reading it all
+                    if e.errno != errno.EPIPE:
+                        raise
+
+            feeder = threading.Thread(target=feed_stdin)
+            feeder.daemon = True
+            feeder.start()
+
+        for line in iter(lambda: proc1.stdout.readline(Cmd.stream_line_limit), ''):
+            counted[0] += len(line)
+            out_lines.append(line)
+            if stream:
+                Log.output(line, name)
+
+        reader.join()
+        if feeder is not None:
+            feeder.join()
+        if timer is not None:
+            timer.cancel()
+        returncode, maxrss = Cmd.reap(proc1)
+
+        result = CmdResult(returncode, ''.join(out_lines), ''.join(err_tail), counted[0] + counted[1], maxrss,
+                           bool(timed_out))
+        if Replay.recording():
+            Replay.record(name, cmd, result.returncode, result.out, result.err, time.time() - started)
+        Tracer.end(span, name, cmd, result)
+        return result
 
-        # Poll process for new output until finished
+    @staticmethod
+    def reap(proc1):
+        # wait4 instead of Popen.wait so the child's peak rss comes back too
         while True:
-            nextline = proc1.stdout.readline()
-            if nextline == '' and proc1.poll() is not None:
+            try:
+                pid, status, rusage = os.wait4(proc1.pid, 0)
                 break
-            sys.stdout.write(nextline)
-            sys.stdout.flush()
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    # already reaped elsewhere
+                    proc1.wait()
+                    return proc1.returncode, None
+                raise
+
+        if os.WIFSIGNALED(status):
+            proc1.returncode = -os.WTERMSIG(status)
+        else:
+            proc1.returncode = os.WEXITSTATUS(status)
 
-        output = proc1.communicate()
+        maxrss = rusage.ru_maxrss
+        if sys.platform == "darwin":
+            maxrss = maxrss / 1024
+        return proc1.returncode, maxrss
 
-        if proc1.returncode != 0:
+    @staticmethod
+    def local_run_stream(cmd, setsid=True, name=None, stdin=None):
+        result = Cmd.execute(name or cmd, cmd, stream=True, setsid=setsid, stdin=stdin)
+        return result.returncode, result.out, result.err
+
+    @staticmethod
+    def local_run_realtime(name, cmd):
+        returncode, out, err = Cmd.local_run_stream(cmd, setsid=False, name=name)
+
+        if returncode != 0:
             Static.msg_bold("FAIL", name.upper())
-            sys.stdout.write(output[1])
+            Static.write(err)
             raise SystemExit(32)
 
     @staticmethod
     def local_run_realtime_continue_on_fail(name, cmd):
-        proc1 = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+        returncode, out, err = Cmd.local_run_stream(cmd, setsid=False, name=name)
 
-        # Poll process for new output until finished
-        while True:
-            nextline = proc1.stdout.readline()
-            if nextline == '' and proc1.poll() is not None:
-                break
-            sys.stdout.write(nextline)
-            sys.stdout.flush()
-
-        output = proc1.communicate()
-        if proc1.returncode != 0:
-            Static.msg_bold("FAIL {0}".format(name.upper()), output[1])
+        if returncode != 0:
+            Static.msg_bold("FAIL {0}".format(name.upper()), err)
 
     @staticmethod
-    def local_run_long(name, cmd):
-        proc1 = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, preexec_fn=os.setsid)
+    def local_run_long(name, cmd, stdin=None):
+        returncode, out, err = Cmd.local_run_stream(cmd, name=name, stdin=stdin)
 
-        while proc1.returncode is None:
-            for line in proc1.stdout:
-                sys.stdout.write(line)
-            proc1.poll()
-
-        if proc1.returncode != 0:
+        if returncode != 0:
             Static.msg_bold("FAIL", name.upper())
-            for line in iter(proc1.stderr.readline, ''):
-                sys.stdout.write(line)
+            Static.write(err)
             raise SystemExit(32)
 
     @staticmethod
     def local_sudo_prompt_run(name, cmd):
+        if Replay.replaying():
+            returncode, out, err = Replay.serve(name, cmd)
+            if returncode != 0:
+                Static.msg_bold("Password failed most likely. Possibly some other error. Inspect below.", name.upper())
+                Static.echo((out, err))
+                raise SystemExit(32)
+            return
+
         password = None
         if not os.geteuid() == 0:
-            print
-            print "You must be root to run this command."
-            print
+            Static.echo()
+            Static.echo("You must be root to run this command.")
+            Static.echo()
+            Log.flush()
             password = getpass.getpass()
-            print
+            Static.echo()
 
         #proc1 = subprocess.Popen(['sudo', '-p', '-k', '-S', cmd], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         proc1 = subprocess.Popen('/usr/bin/sudo -p -k -S {0}'.format(cmd), shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         out = proc1.communicate(input='{0}\n'.format(password))
+        if Replay.recording():
+            Replay.record(name, cmd, proc1.returncode, out[0], out[1], 0)
 
         if proc1.returncode != 0:
             Static.msg_bold("Password failed most likely. Possibly some other error. Inspect below.", name.upper())
-            print out
+            Static.echo(out)
             raise SystemExit(32)
 
 
     @staticmethod
     def local_run_get_out(name, cmd):
-        proc1 = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, preexec_fn=os.setsid)
-        out = proc1.communicate()
+        return Cmd.local_run_get_out_raw(name, cmd).replace('\n','')
 
-        if proc1.returncode != 0:
+    @staticmethod
+    def local_run_get_out_raw(name, cmd):
+        result = Cmd.execute(name, cmd)
+
+        if result.returncode != 0:
             Static.msg_bold("FAIL", name.upper())
-            sys.stdout.write(out[1])
+            Static.write(result.err)
             raise SystemExit(32)
 
-        return out[0].replace('\n','')
+        return result.out
 
     @staticmethod
-    def local_run_get_out_raw(name, cmd):
-        proc1 = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, preexec_fn=os.setsid)
-        out = proc1.communicate()
+    def local_run_capture(name, cmd):
+        result = Cmd.execute(name, cmd)
 
-        if proc1.returncode != 0:
-            Static.msg_bold("FAIL", name.upper())
-            sys.stdout.write(out[1])
-            raise SystemExit(32)
+        if result.returncode != 0:
+            raise CmdFailed(name, cmd, result.returncode, result.out, result.err)
 
-        return out[0]
+        return result.out
 
     @staticmethod
-    def local_run_long_until_success(name, cmd):
-        attempt = 1
-        while attempt < 101:
-            try:
-                if attempt > 1:
-                    Static.msg("RETRYING", "VALIDATE in 15s")
-                    time.sleep(15)
+    def local_run_parallel(jobs, max_workers=None):
+        # jobs is a list of (name, cmd); raw outputs come back in the same order
+        ex = Executor(max_workers)
+        for name, cmd in jobs:
+            ex.submit(name, Cmd.local_run_capture, name, cmd)
+
+        try:
+            return ex.gather()
+        except CmdFailed as e:
+            Static.msg_bold("FAIL", e.name.upper())
+            Static.write(e.err)
+            raise SystemExit(32)
+
+    @staticmethod
+    def local_run_long_until_success(name, cmd, retry=None):
+        retry = retry or Retry(name)
 
-                Cmd.local_run_long(name, cmd)
-                return
-            except:
-                attempt += 1
+        def probe():
+            returncode, out, err = Cmd.local_run_stream(cmd, name=name)
+            if returncode == 0:
+                return Retry.DONE, None
+            # commands often fold stderr into stdout with 2>&1, check both
+            return Retry.classify(returncode, out + err), err or out
 
+        retry.run(probe)
 
     @staticmethod
-    def local_run_long_until_ready(name, cmd):
-        result = False
-        while not result:
-            proc1 = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, preexec_fn=os.setsid)
-            proc1.wait()
+    def local_run_long_until_ready(name, cmd, retry=None):
+        # ready once the output lists "ready: true" and nothing is "ready: false"
+        retry = retry or Retry(name, initial=2.0, maximum=15.0)
+
+        def probe():
+            result = Cmd.execute(name, cmd)
+            if result.returncode != 0:
+                return Retry.classify(result.returncode, result.err), result.err
+            if "ready: true" in result.out and "ready: false" not in result.out:
+                return Retry.DONE, None
+            Static.msg("Waiting for", name.upper())
+            return Retry.RETRY, None
+
+        retry.run(probe)
+        Static.msg("Success for", name.upper())
 
-            for line in iter(proc1.stdout.readline, ''):
-                if not "ready: true" in line:
-                    Static.msg("Waiting for", name.upper())
-                    time.sleep(10)
-                    continue
+    @staticmethod
+    def exec_capture(argv, name=None):
+        # argv list, no shell: no quoting hazards and one process per call
+        result = Cmd.execute(name or argv[0], list(argv))
+        return result.returncode, result.out, result.err
 
-            Static.msg("Success for", name.upper())
-            return
+    @staticmethod
+    def exec_get_out_raw(name, argv):
+        returncode, out, err = Cmd.exec_capture(argv, name)
+
+        if returncode != 0:
+            Static.msg_bold("FAIL", name.upper())
+            Static.write(err)
+            raise SystemExit(32)
+
+        return out
 
     @staticmethod
-    def local_run_return_bool(name, cmd):
-        proc1 = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, preexec_fn=os.setsid)
-        proc1.wait()
+    def exec_get_out(name, argv):
+        return Cmd.exec_get_out_raw(name, argv).replace('\n', '')
 
-        if proc1.returncode == 0:
-            return True
-        else:
-            return False
+    @staticmethod
+    def exec_return_bool(name, argv):
+        returncode, out, err = Cmd.exec_capture(argv, name)
+        return returncode == 0
 
+    @staticmethod
+    def local_run_return_bool(name, cmd):
+        return Cmd.execute(name, cmd).returncode == 0
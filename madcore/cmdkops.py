@@ -24,6 +24,7 @@ SOFTWARE.
 
 from static import Static
 from cmd import Cmd
+from retry import Retry
 import subprocess
 import os
 import sys
@@ -39,14 +40,14 @@ class CmdKops(object):
     settings = None
     localtemplate = None
 
+    file_local_cluster = "kops.1.9.0.cluster.yaml"
+    file_local_master = "kops.1.9.0.master.yaml"
+    file_local_nodes = "kops.1.9.0.ig.yaml"
+
     def __init__(self, in_settings):
         self.settings = in_settings
         self.localtemplate = localtemplate.LocalTemplate(self.settings)
 
-        self.file_local_cluster = "kops.1.9.0.cluster.yaml"
-        self.file_local_master = "kops.1.9.0.master.yaml"
-        self.file_local_nodes = "kops.1.9.0.ig.yaml"
-
     def get_ig_filename(self, ig):
         return "kops.1.9.0.ig.{0}.yaml".format(ig)
 
@@ -61,7 +62,7 @@ class CmdKops(object):
             self.settings.provision.s3_store,
             self.settings.provision.domain
         )
-        print cmd
+        Static.echo(cmd)
         Static.msg(name, "KOPS: aws")
         Cmd.local_run_long(name, cmd)
 
@@ -98,15 +99,40 @@ class CmdKops(object):
         name = "UPDATE KOPS SETTINGS"
         Static.figletcyber(name)
 
-        # CLUSTER ====
+        # FETCH REMOTE ====
+        # remote settings are independent of each other, pull them all at once
+        jobs = []
         task = "Get Kops Cluster settings"
         cmd = "kops get cluster -oyaml --state={0} > {1}/remote.{2}".format(
             self.settings.provision.s3_store,
             self.settings.folder_user_populated,
             self.file_local_cluster)
-        Static.msg(name, task)
-        Cmd.local_run_long(name, cmd)
+        jobs.append((task, cmd))
+
+        task = "Get Kops Master settings"
+        cmd = "kops get ig --name={0} master-{1} -oyaml --state={2} > {3}/remote.{4}".format(
+            self.settings.provision.domain,
+            self.settings.aws_zone,
+            self.settings.provision.s3_store,
+            self.settings.folder_user_populated,
+            self.file_local_master)
+        jobs.append((task, cmd))
+
+        for ig in self.settings.provision.instance_groups:
+            single_ig = Struct(**ig)
+            task = "Get Kops Instance Group {0} settings".format(single_ig.name)
+            cmd = "kops get ig --name={0} nodes -oyaml --state={1} > {2}/remote.{3}".format(
+                self.settings.provision.domain,
+                self.settings.provision.s3_store,
+                self.settings.folder_user_populated,
+                self.get_ig_filename(single_ig.name))
+            jobs.append((task, cmd))
 
+        for task, cmd in jobs:
+            Static.msg(name, task)
+        Cmd.local_run_parallel(jobs)
+
+        # CLUSTER ====
         task = "Render Cluster Template"
         Static.msg(name, task)
         self.localtemplate.generate_template(self.file_local_cluster)
@@ -121,16 +147,6 @@ class CmdKops(object):
         Cmd.local_run_long(name, cmd)
 
         # MASTER ====
-        task = "Get Kops Master settings"
-        cmd = "kops get ig --name={0} master-{1} -oyaml --state={2} > {3}/remote.{4}".format(
-            self.settings.provision.domain,
-            self.settings.aws_zone,
-            self.settings.provision.s3_store,
-            self.settings.folder_user_populated,
-            self.file_local_master)
-        Static.msg(name, task)
-        Cmd.local_run_long(name, cmd)
-
         task = "Render Master Template"
         Static.msg(name, task)
         self.localtemplate.generate_template(self.file_local_master)
@@ -149,15 +165,6 @@ class CmdKops(object):
             single_ig = Struct(**ig)
             populated_ig_file = self.get_ig_filename(single_ig.name)
 
-            task = "Get Kops Instance Group {0} settings".format(single_ig.name)
-            cmd = "kops get ig --name={0} nodes -oyaml --state={1} > {2}/remote.{3}".format(
-                self.settings.provision.domain,
-                self.settings.provision.s3_store,
-                self.settings.folder_user_populated,
-                populated_ig_file)
-            Static.msg(name, task)
-            Cmd.local_run_long(name, cmd)
-
             task = "Render Instance Group {0} Template".format(single_ig.name)
             Static.msg(name, task)
             self.localtemplate.generate_template_node(self.file_local_nodes, populated_ig_file, single_ig)
@@ -171,7 +178,7 @@ class CmdKops(object):
             Static.msg(name, task)
             Cmd.local_run_long(name, cmd)
 
-        print
+        Static.echo()
 
     def add_instance_group(self, name):
         single_ig = Struct(**list(filter(lambda d: d['name'] in [name], self.settings.provision.instance_groups))[0])
@@ -210,7 +217,7 @@ class CmdKops(object):
             self.settings.provision.kops_verbosity
         )
         Static.msg(name, task)
-        print cmd
+        Static.echo(cmd)
         Cmd.local_run_long(name, cmd)
 
         self.validate_cluster()
@@ -232,7 +239,7 @@ class CmdKops(object):
             self.settings.provision.kops_verbosity
         )
         Static.msg(name, task)
-        print cmd
+        Static.echo(cmd)
         Cmd.local_run_long(name, cmd)
 
         self.validate_cluster()
@@ -245,8 +252,9 @@ class CmdKops(object):
             self.settings.provision.s3_store,
             self.settings.provision.kops_verbosity
         )
-        print cmd
-        Cmd.local_run_long_until_success(name, cmd)
+        Static.echo(cmd)
+        # a fresh cluster takes minutes to validate, poll up to 25 minutes
+        Cmd.local_run_long_until_success(name, cmd, Retry(task, deadline=1500, initial=5.0, maximum=30.0))
         Static.msg("Provisioning of Kubernetes Cluster", "VERIFIED")
 
 
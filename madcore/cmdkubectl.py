@@ -24,67 +24,135 @@ SOFTWARE.
 
 from static import Static
 from cmd import Cmd
+from retry import Retry
+from executor import Executor
+from kubeapi import KubeApi, KubeApiError
+from prettytable import PrettyTable
 import subprocess
 import os
 import sys
 import localtemplate
+import cmdminikube
+import json
+
+
+MASTER_LABEL = "node-role.kubernetes.io/master"
 
 
 class CmdKubectl(object):
     settings = None
     localtemplate = None
+    kubeapi = None
 
     def __init__(self, in_settings):
         self.settings = in_settings
         self.localtemplate = localtemplate.LocalTemplate(self.settings)
 
-    def apply(self, component_item):
-
-        cmd = "kubectl apply -f {0}/{1}".format(
+    def api(self):
+        # in-process api client when enabled with --kube-api, None means kubectl
+        if self.kubeapi is None:
+            self.kubeapi = False
+            if getattr(self.settings.args, "kube_api", False):
+                try:
+                    self.kubeapi = KubeApi.shared(self.settings.kube_context)
+                except KubeApiError as e:
+                    Static.msg_bold("Kube API client unavailable, using kubectl", e.message)
+        return self.kubeapi or None
+
+    def api_call(self, name, fn, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except (KubeApiError, IOError) as e:
+            Static.msg_bold("FAIL", name.upper())
+            Static.echo(e)
+            raise SystemExit(32)
+
+    def format_table(self, headers, rows):
+        if not rows:
+            return "No resources found.\n"
+        table = PrettyTable(headers)
+        table.border = False
+        table.align = "l"
+        for row in rows:
+            table.add_row(row)
+        return table.get_string() + "\n"
+
+    def apply(self, component_item, data=None):
+        # data is the rendered manifest, piped in instead of read from
+        # the populated file
+        filepath = "{0}/{1}".format(
             self.settings.folder_user_populated,
             component_item.template
         )
         Static.msg("Adding Component", component_item.name)
-        Cmd.local_run_long(component_item.name, cmd)
+        if data is None and self.api():
+            with open(filepath) as f:
+                data = f.read()
+        self.apply_data(component_item.name, data, filepath)
+
+    def apply_batch(self, name, data):
+        # the documents of many elements in one apply
+        Static.msg("Adding Components", name)
+        self.apply_data(name, data)
+
+    def apply_data(self, name, data, filepath=None):
+        server_side = getattr(self.settings.args, "server_side", False)
+        if self.api():
+            fn = self.api().server_side_apply_yaml if server_side else self.api().apply_yaml
+            self.api_call(name, fn, data)
+            return
+
+        cmd = ["apply"]
+        if server_side:
+            # madcore owns what it renders, take over fields from other managers
+            cmd += ["--server-side", "--force-conflicts", "--field-manager", "madcore"]
+        if data is not None:
+            Cmd.local_run_long(name, self.kubectl(cmd + ["-f", "-"]), stdin=data)
+            return
+        Cmd.local_run_long(name, self.kubectl(" ".join(cmd + ["-f", filepath])))
+
+    def kubectl(self, cmd):
+        # kubectl argv list or command string. pinned to settings.kube_context
+        # when one is set (fleet mode), instead of the global current-context
+        context = self.settings.kube_context
+        if isinstance(cmd, list):
+            return ["kubectl"] + (["--context", context] if context else []) + cmd
+        if context:
+            return "kubectl --context {0} {1}".format(context, cmd)
+        return "kubectl {0}".format(cmd)
+
+    def context_name(self):
+        if self.settings.provision.cloud != "minikube":
+            return self.settings.provision.domain
+        return "minikube"
 
     def use_context(self):
         name = "Kubectl Use Context"
-        cmd = None
-        context = None
-        if self.settings.provision.cloud != "minikube":
-            cmd = "kubectl config use-context {0}".format(
-                self.settings.provision.domain
-            )
-            context = self.settings.provision.domain
-        else:
-            cmd = "kubectl config use-context minikube"
-            context = "minikube"
+        context = self.context_name()
+        cmd = "kubectl config use-context {0}".format(context)
         Static.msg(name, context)
         Cmd.local_run_long(name, cmd)
-        print
+        Static.echo()
 
     def get_context(self):
         name = "kubectl config current-context"
-        cmd = "kubectl config current-context"
-        self.settings.current_context = Cmd.local_run_get_out(name, cmd)
+        if self.settings.kube_context:
+            self.settings.current_context = self.settings.kube_context
+        elif self.api():
+            self.settings.current_context = self.api().context
+        else:
+            argv = ["kubectl", "config", "current-context"]
+            self.settings.current_context = Cmd.exec_get_out(name, argv)
         Static.msg(name,  self.settings.current_context)
         return self.settings.current_context
 
     def get_master_ip(self):
         name = "Get Master IP"
         if self.get_context() == "minikube":
-            cmd = "minikube ip"
-            self.settings.master_ip = Cmd.local_run_get_out(name, cmd)
+            argv = ["minikube", "ip"]
+            self.settings.master_ip = Cmd.exec_get_out(name, argv)
         else:
-            cmd = "kubectl get nodes | grep master | sed 's/ .*//'"
-            master_node = Cmd.local_run_get_out(name, cmd)
-            ip_list = master_node.split('-') # highly dependant on hostname not being changed from amazon default. find better way fast (example: 'ip-172-32-56-155.ec2.internal')
-            self.settings.master_ip = '{0}.{1}.{2}.{3}'.format(
-                ip_list[1],
-                ip_list[2],
-                ip_list[3],
-                ip_list[4].split('.')[0],
-            )
+            self.settings.master_ip = self.ip_from_hostname(self.query_master_node(name))
 
         Static.msg(name, self.settings.master_ip)
         return self.settings.master_ip
@@ -100,45 +168,71 @@ class CmdKubectl(object):
         Static.msg(name, self.settings.ingress_ips)
         return self.settings.ingress_ips
 
+    def ip_from_hostname(self, hostname):
+        # highly dependant on hostname not being changed from amazon default. find better way fast (example: 'ip-172-32-56-155.ec2.internal')
+        ip_list = hostname.split('-')
+        return '{0}.{1}.{2}.{3}'.format(
+            ip_list[1],
+            ip_list[2],
+            ip_list[3],
+            ip_list[4].split('.')[0],
+        )
+
     def get_ig_ips(self, ig):
         task = "Get Instancegroup IPS"
-        cmd = 'kubectl get nodes -o wide --show-labels | grep "instancegroup={0}" | cut -d" " -f1'.format(ig)
-        #        print cmd
-        result = Cmd.local_run_get_out_raw(task, cmd)
+        selector = "kops.k8s.io/instancegroup={0}".format(ig)
+        if self.api():
+            nodes = self.api_call(task, self.api().list, "/api/v1/nodes", labelSelector=selector)
+            return [self.ip_from_hostname(node["metadata"]["name"]) for node in nodes]
+
+        argv = self.kubectl(["get", "nodes", "--no-headers", "-l", selector])
+        result = Cmd.exec_get_out_raw(task, argv)
         outlist = []
-        for line in result.split("\n"):
-            if line:
-                line = line.split('-') # highly dependant on hostname not being changed from amazon default. find better way fast (example: 'ip-172-32-56-155.ec2.internal')
-                outlist.append('{0}.{1}.{2}.{3}'.format(
-                    line[1],
-                    line[2],
-                    line[3],
-                    line[4].split('.')[0]
-                ))
-
-        #       print outlist
+        for line in result.splitlines():
+            if line.strip():
+                outlist.append(self.ip_from_hostname(line.split()[0]))
+
         return outlist
 
+    def query_master_node(self, name):
+        # first column of the first node row mentioning master
+        if self.api():
+            for node in self.api_call(name, self.api().list, "/api/v1/nodes"):
+                if MASTER_LABEL in (node["metadata"].get("labels") or {}) or "master" in node["metadata"]["name"]:
+                    return node["metadata"]["name"]
+        else:
+            result = Cmd.exec_get_out_raw(name, self.kubectl(["get", "nodes", "--no-headers"]))
+            for line in result.splitlines():
+                if "master" in line:
+                    return line.split()[0]
+        Static.msg_bold("FAIL", "{0}: no master node found".format(name.upper()))
+        raise SystemExit(32)
+
     def get_master_node(self):
         name = "Get Master Node"
-        cmd = "kubectl get nodes | grep master | sed 's/ .*//'"
-        master_node = Cmd.local_run_get_out(name, cmd)
+        master_node = self.query_master_node(name)
         Static.msg(name, master_node)
         return master_node
 
     def get_registry_pod(self):
         name = "Get Registry Pod"
-        cmd = "kubectl get pods --namespace kube-system -l k8s-app=kube-registry-upstream -o template --template '{{range .items}}{{.metadata.name}} {{.status.phase}}{{\"\\n\"}}{{end}}'"
-        master_node = Cmd.local_run_get_out(name, cmd).split(' ')[0]
+        if self.api():
+            pods = self.api_call(name, self.api().list, "/api/v1/namespaces/kube-system/pods",
+                                 labelSelector="k8s-app=kube-registry-upstream")
+            master_node = pods[0]["metadata"]["name"] if pods else ''
+        else:
+            argv = self.kubectl(["get", "pods", "--namespace", "kube-system", "-l", "k8s-app=kube-registry-upstream",
+                    "-o", "jsonpath={.items[*].metadata.name}"])
+            master_node = Cmd.exec_get_out(name, argv).split(' ')[0]
         Static.msg(name, master_node)
         return master_node
 
     def registry_port_forward_enable(self):
         name = "Enable PortForward to Registy"
-        cmd = "kubectl port-forward --namespace kube-system {0} 5000:5000 & echo $$! > {1}/port-forward.pid".format(
-            self.settings.folder_user_populated,
-            self.get_registry_pod()
-        )
+        cmd = self.kubectl("port-forward --namespace kube-system {0} 5000:5000 & echo $$! > {1}/port-forward.pid".format(
+            self.get_registry_pod(),
+            self.settings.folder_user_populated
+        ))
         master_node = Cmd.local_run_get_out(name, cmd)
         Static.msg(name, master_node)
         Static.msg(">", cmd)
@@ -160,9 +254,13 @@ class CmdKubectl(object):
 
         name = "Remove Taint Master"
         master_node = self.get_master_node()
-        cmd = "kubectl taint nodes {0} node-role.kubernetes.io/master-".format(
+        if self.api():
+            Static.msg(name, master_node)
+            self.api_call(name, self.set_master_taint, master_node, None)
+            return
+        cmd = self.kubectl("taint nodes {0} node-role.kubernetes.io/master-".format(
             master_node
-        )
+        ))
         Static.msg(name, master_node)
         try:
             Cmd.local_run_long(name, cmd)
@@ -173,50 +271,212 @@ class CmdKubectl(object):
 
         name = "Add Taint Master. No Schedule"
         master_node = self.get_master_node()
-        cmd = "kubectl taint nodes {0} node-role.kubernetes.io/master=:NoSchedule".format(
+        if self.api():
+            Static.msg(name, master_node)
+            self.api_call(name, self.set_master_taint, master_node, "NoSchedule")
+            return
+        cmd = self.kubectl("taint nodes {0} node-role.kubernetes.io/master=:NoSchedule".format(
             master_node
-        )
+        ))
         Static.msg(name, master_node)
         Cmd.local_run_long(name, cmd)
 
+    def set_master_taint(self, master_node, effect):
+        # drop every master taint, then add the requested one back
+        path = "/api/v1/nodes/{0}".format(master_node)
+        node = self.api().get(path)
+        taints = [t for t in node["spec"].get("taints") or [] if t["key"] != MASTER_LABEL]
+        if effect:
+            taints.append({"key": MASTER_LABEL, "value": "", "effect": effect})
+        self.api().patch(path, {"spec": {"taints": taints}}, "merge")
+
+    def api_nodes_table(self):
+        rows = []
+        for node in self.api().list("/api/v1/nodes"):
+            labels = node["metadata"].get("labels") or {}
+            conditions = dict((c["type"], c["status"]) for c in node["status"].get("conditions") or [])
+            addresses = dict((a["type"], a["address"]) for a in node["status"].get("addresses") or [])
+            rows.append([
+                node["metadata"]["name"],
+                "Ready" if conditions.get("Ready") == "True" else "NotReady",
+                ",".join(sorted(k.split("/")[1] for k in labels if k.startswith("node-role.kubernetes.io/"))) or "<none>",
+                node["status"].get("nodeInfo", {}).get("kubeletVersion", ""),
+                addresses.get("InternalIP", "<none>"),
+                ",".join("{0}={1}".format(k, v) for k, v in sorted(labels.items())),
+            ])
+        return self.format_table(["NAME", "STATUS", "ROLES", "VERSION", "INTERNAL-IP", "LABELS"], rows)
+
+    def api_pods_table(self):
+        rows = []
+        pods = self.api().list("/api/v1/pods")
+        for pod in sorted(pods, key=lambda p: p["spec"].get("nodeName") or ""):
+            statuses = pod["status"].get("containerStatuses") or []
+            rows.append([
+                pod["metadata"]["namespace"],
+                pod["metadata"]["name"],
+                "{0}/{1}".format(len([c for c in statuses if c.get("ready")]), len(pod["spec"]["containers"])),
+                pod["status"].get("phase", ""),
+                sum(c.get("restartCount", 0) for c in statuses),
+                pod["status"].get("podIP", "<none>"),
+                pod["spec"].get("nodeName", "<none>"),
+            ])
+        return self.format_table(["NAMESPACE", "NAME", "READY", "STATUS", "RESTARTS", "IP", "NODE"], rows)
+
+    def api_svc_table(self):
+        rows = []
+        for svc in self.api().list("/api/v1/services"):
+            ingress = (svc["status"].get("loadBalancer") or {}).get("ingress") or []
+            external = [i.get("ip") or i.get("hostname") for i in ingress] + (svc["spec"].get("externalIPs") or [])
+            rows.append([
+                svc["metadata"]["namespace"],
+                svc["metadata"]["name"],
+                svc["spec"].get("type", ""),
+                svc["spec"].get("clusterIP", ""),
+                ",".join(external) or "<none>",
+                ",".join("{0}{1}/{2}".format(
+                    p["port"], ":{0}".format(p["nodePort"]) if p.get("nodePort") else "", p.get("protocol", "TCP"))
+                    for p in svc["spec"].get("ports") or []),
+            ])
+        return self.format_table(["NAMESPACE", "NAME", "TYPE", "CLUSTER-IP", "EXTERNAL-IP", "PORT(S)"], rows)
+
+    def api_ingresses(self):
+        # extensions/v1beta1 is gone from 1.22 on
+        try:
+            return self.api().list("/apis/extensions/v1beta1/ingresses")
+        except KubeApiError as e:
+            if e.status != 404:
+                raise
+            return self.api().list("/apis/networking.k8s.io/v1/ingresses")
+
+    def api_ing_table(self):
+        rows = []
+        for ing in self.api_ingresses():
+            ingress = (ing["status"].get("loadBalancer") or {}).get("ingress") or []
+            rows.append([
+                ing["metadata"]["namespace"],
+                ing["metadata"]["name"],
+                ",".join(r.get("host", "*") for r in ing["spec"].get("rules") or []) or "*",
+                ",".join(i.get("ip") or i.get("hostname") for i in ingress),
+                "80, 443" if ing["spec"].get("tls") else "80",
+            ])
+        return self.format_table(["NAMESPACE", "NAME", "HOSTS", "ADDRESS", "PORTS"], rows)
+
     def get_nodes(self):
         name = "Get Nodes"
-        cmd = "kubectl get nodes --show-labels -o wide"
+        cmd = self.kubectl("get nodes --show-labels -o wide")
         Static.msg(name, self.settings.provision.domain)
-        Cmd.local_run_long(name, cmd)
-        print
+        if self.api():
+            Static.write(self.api_call(name, self.api_nodes_table))
+        else:
+            Cmd.local_run_long(name, cmd)
+        Static.echo()
 
     def get_pods(self):
         name = "Get Pods (sorted by nodeName)"
-        cmd = 'kubectl get pods --all-namespaces -o wide --sort-by="{.spec.nodeName}"'
+        cmd = self.kubectl('get pods --all-namespaces -o wide --sort-by="{.spec.nodeName}"')
         Static.msg(name, self.settings.provision.domain)
-        Cmd.local_run_long(name, cmd)
-        print
+        if self.api():
+            Static.write(self.api_call(name, self.api_pods_table))
+        else:
+            Cmd.local_run_long(name, cmd)
+        Static.echo()
 
     def get_svc(self):
         name = "Get Services"
-        cmd = "kubectl get svc --all-namespaces"
+        cmd = self.kubectl("get svc --all-namespaces")
         Static.msg(name, self.settings.provision.domain)
-        Cmd.local_run_long(name, cmd)
-        print
+        if self.api():
+            Static.write(self.api_call(name, self.api_svc_table))
+        else:
+            Cmd.local_run_long(name, cmd)
+        Static.echo()
 
     def get_ing(self):
         name = "Get Ingress"
-        cmd = "kubectl get ing --all-namespaces"
+        cmd = self.kubectl("get ing --all-namespaces")
         Static.msg(name, self.settings.provision.domain)
-        Cmd.local_run_long(name, cmd)
-        print
+        if self.api():
+            Static.write(self.api_call(name, self.api_ing_table))
+        else:
+            Cmd.local_run_long(name, cmd)
+        Static.echo()
+
+    def get_status(self):
+        if self.api():
+            tables = [
+                ("Get Nodes", self.api_nodes_table),
+                ("Get Pods (sorted by nodeName)", self.api_pods_table),
+                ("Get Services", self.api_svc_table),
+                ("Get Ingress", self.api_ing_table),
+            ]
+            ex = Executor()
+            for name, fn in tables:
+                ex.submit(name, fn)
+            results = self.api_call("Get Status", ex.gather)
+            for (name, fn), out in zip(tables, results):
+                Static.msg(name, self.settings.provision.domain)
+                Static.write(out)
+                Static.echo()
+            return
+
+        # queries are independent, run them together and print in fixed order
+        jobs = [
+            ("Get Nodes", self.kubectl("get nodes --show-labels -o wide")),
+            ("Get Pods (sorted by nodeName)", self.kubectl('get pods --all-namespaces -o wide --sort-by="{.spec.nodeName}"')),
+            ("Get Services", self.kubectl("get svc --all-namespaces")),
+            ("Get Ingress", self.kubectl("get ing --all-namespaces")),
+        ]
+        results = Cmd.local_run_parallel(jobs)
+        for (name, cmd), out in zip(jobs, results):
+            Static.msg(name, self.settings.provision.domain)
+            Static.write(out)
+            Static.echo()
+
+    def get_endpoint_urls(self):
+        # element endpoints are the hosts of every ingress rule
+        name = "Get Ingress Hosts"
+        if self.api():
+            ingresses = self.api_call(name, self.api_ingresses)
+        else:
+            out = Cmd.exec_get_out_raw(name, self.kubectl(["get", "ing", "--all-namespaces", "-o", "json"]))
+            ingresses = json.loads(out).get("items") or []
+
+        hosts = []
+        for ing in ingresses:
+            for rule in ing["spec"].get("rules") or []:
+                if rule.get("host") and rule["host"] not in hosts:
+                    hosts.append(rule["host"])
+        if not hosts and self.settings.provision.cloud == "minikube":
+            hosts = [h for h in cmdminikube.MINIKUBE_HOSTS if h != "minikube.local"]
+        return ["http://{0}/".format(h) for h in hosts]
 
     def get_all_on_namespace(self, name):
-        cmd = "kubectl get pods,svc,ing --namespace={0}".format(name)
+        cmd = self.kubectl("get pods,svc,ing --namespace={0}".format(name))
         Static.msg("Displaying status of namespace", name)
         Cmd.local_run_long("Get Namespace Details", cmd)
 
     def wait_until_kube_system_ready(self):
         name = "Wait Until Kube-System Ready"
-        cmd = "kubectl get pods -n kube-system -o=yaml | grep 'ready: true'"
+        cmd = self.kubectl("get pods -n kube-system -o=yaml")
+        retry = Retry(name, deadline=600, initial=2.0, maximum=15.0)
         Static.msg(name, "")
-        Cmd.local_run_long_until_ready(name, cmd)
+        if not self.api():
+            Cmd.local_run_long_until_ready(name, cmd, retry)
+            return
+
+        def probe():
+            try:
+                pods = self.api().list("/api/v1/namespaces/kube-system/pods")
+            except KubeApiError as e:
+                return Retry.classify(e.status, e.message), str(e)
+            statuses = [c for pod in pods for c in pod["status"].get("containerStatuses") or []]
+            if statuses and all(c.get("ready") for c in statuses):
+                return Retry.DONE, None
+            Static.msg("Waiting for", name.upper())
+            return Retry.RETRY, None
+
+        retry.run(probe)
+        Static.msg("Success for", name.upper())
 
 
 
@@ -24,14 +24,30 @@ SOFTWARE.
 
 from static import Static
 from cmd import Cmd
+from retry import Retry
 import subprocess
 import os
 import sys
 import localtemplate
 
 
+# hostnames pointed at the minikube ip in /etc/hosts
+MINIKUBE_HOSTS = [
+    "minikube.local",
+    "registry.minikube.local",
+    "elasticsearch.minikube.local",
+    "kibana.minikube.local",
+    "kafka.minikube.local",
+    "rest.kafka.minikube.local",
+    "grafana.minikube.local",
+    "flink.minikube.local",
+    "neo4j.minikube.local",
+]
+
+
 class Minikube(object):
     settings = None
+    hosts_file = "/etc/hosts"
 
     def __init__(self, in_settings):
         self.settings = in_settings
@@ -56,14 +72,26 @@ class Minikube(object):
 
     def confirm_started(self):
         name = "Minikube Confirm Started"
-        cmd = "until kubectl get serviceaccount -n kube-system | grep -m 1 'default'; do sleep 1; done"
+        argv = ["kubectl", "get", "serviceaccount", "-n", "kube-system", "--no-headers"]
         Static.msg(name, '.')
-        Cmd.local_run_realtime(name, cmd)
+
+        def probe():
+            returncode, out, err = Cmd.exec_capture(argv, name)
+            for line in out.splitlines():
+                if line.split() and line.split()[0] == "default":
+                    return Retry.DONE, line
+            if returncode != 0:
+                return Retry.classify(returncode, err), err
+            return Retry.RETRY, None
+
+        Static.echo(Retry(name, deadline=600, initial=1.0, maximum=5.0).run(probe))
 
     def is_minikube_in_hosts(self):
         name = "Is minikube.local in hostsfile"
-        cmd = "grep -q 'minikube.local' /etc/hosts"
-        is_present = Cmd.local_run_return_bool(name, cmd)
+        is_present = False
+        if os.path.isfile(self.hosts_file):
+            with open(self.hosts_file) as f:
+                is_present = any('minikube.local' in line for line in f)
         Static.msg(name, is_present)
         return is_present
 
@@ -71,7 +99,7 @@ class Minikube(object):
         self.get_minikube_ip()
 
         name = "Add minikube.local to /etc/hosts"
-        cmd = "bash -c \"echo $'{0}\tminikube.local registry.minikube.local elasticsearch.minikube.local kibana.minikube.local kafka.minikube.local rest.kafka.minikube.local grafana.minikube.local flink.minikube.local neo4j.minikube.local' >> /etc/hosts\"".format(self.settings.master_ip)
+        cmd = "bash -c \"echo $'{0}\t{1}' >> /etc/hosts\"".format(self.settings.master_ip, " ".join(MINIKUBE_HOSTS))
         Static.msg(name, '.')
         Cmd.local_sudo_prompt_run(name, cmd)
 
@@ -79,12 +107,11 @@ class Minikube(object):
         self.get_minikube_ip()
 
         name = "Update minikube.local to /etc/hosts"
-        cmd = "sed -i -e $'s/.*minikube.*/{0}\tminikube.local registry.minikube.local elasticsearch.minikube.local kibana.minikube.local  kafka.minikube.local rest.kafka.minikube.local grafana.minikube.local flink.minikube.local neo4j.minikube.local/' /etc/hosts".format(self.settings.master_ip)
+        cmd = "sed -i -e $'s/.*minikube.*/{0}\t{1}/' /etc/hosts".format(self.settings.master_ip, " ".join(MINIKUBE_HOSTS))
         Static.msg(name, '.')
         Cmd.local_sudo_prompt_run(name, cmd)
 
     def get_minikube_ip(self):
         name = "Get minikube ip"
-        cmd = "minikube ip"
-        self.settings.master_ip = Cmd.local_run_get_out(name, cmd)
+        self.settings.master_ip = Cmd.exec_get_out(name, ["minikube", "ip"])
         return self.settings.master_ip
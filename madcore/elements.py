@@ -24,57 +24,403 @@ SOFTWARE.
 
 from static import Static
 from cmd import Cmd
+from executor import Executor
+from applycache import ApplyCache
+from readiness import Readiness, ReadyResult
+from log import Log
+from prettytable import PrettyTable
+import collections
+import multiprocessing
 import subprocess
 import os
 import sys
 import localtemplate
 import cmdkubectl
 import time
+import yaml
 
 class Struct:
     def __init__(self, **entries):
         self.__dict__.update(entries)
 
+# render workers are forked, they inherit the settings from here instead of
+# having them pickled, and build one LocalTemplate per process on first use
+render_settings = None
+render_template = None
+
+
+def render_job(job):
+    global render_template
+    stage, element = job
+    item = Struct(**element)
+    start = time.time()
+    try:
+        if not hasattr(item, "template"):
+            raise KeyError("element has no template")
+        if render_template is None:
+            render_template = localtemplate.LocalTemplate(render_settings)
+        size = render_template.write_element(item).size
+        error = None
+    except BaseException as e:
+        # anything escaping kills the pool worker and its task with it
+        size = None
+        error = "{0}: {1}".format(type(e).__name__, e)
+    return stage, element.get("name"), element.get("template"), time.time() - start, size, error
+
+
 class Elements(object):
     settings = None
     localtemplate = None
     CmdKubectl = None
+    applycache = None
+    readiness = None
+    # one ReadyResult per element handled by install_graph
+    ready = None
+    # stage -> {element name: Rendered}, rendered ahead by prepare_stage
+    prepared = None
+    # the prepared renders of the stage being applied
+    rendered = None
+    # element name -> taint hooks install_graph decided to run for it
+    hooks = None
+    # the master was untainted and its segment re-taints it at the end
+    retaint = False
 
     def __init__(self, in_settings):
         self.settings = in_settings
         self.localtemplate = localtemplate.LocalTemplate(self.settings)
         self.CmdKubectl = cmdkubectl.CmdKubectl(self.settings)
+        self.applycache = ApplyCache(self.settings)
+        self.readiness = Readiness(self.CmdKubectl)
+        self.ready = []
+        self.prepared = {}
+        self.rendered = {}
+        self.hooks = {}
 
     def kubectl_install_elements(self, stage):
-        name = "ELEMENTS"
-        Static.figletcyber('{0} {1}'.format(name, stage.upper()))
+        self.install_stages([stage])
+
+    def install_stages(self, stages):
+        # stages are applied one after the other in one process. each is
+        # rendered and validated while the one before it is being applied.
+        for stage in stages:
+            if stage not in self.settings.elements:
+                Static.msg_bold("Stage not found in clusterfile", stage)
+                raise SystemExit(32)
+
+        ex = Executor(2)
+        ex.submit("cluster ips", self.cluster_ips)
+        previous = None
+        for stage in stages:
+            ex.submit_after("render " + stage, ["cluster ips"] + (["render " + previous] if previous else []),
+                            self.prepare_stage, stage)
+            ex.submit_after("apply " + stage, ["render " + stage] + (["apply " + previous] if previous else []),
+                            self.apply_stage, stage)
+            previous = stage
+        ex.gather()
+
+    def cluster_ips(self):
+        # templates use these, so they are known before anything renders
+        if self.settings.provision.cloud == "minikube":
+            # minikube ingress is the master ip
+            self.CmdKubectl.get_master_ip()
+            self.CmdKubectl.get_ingress_ips()
+        else:
+            ex = Executor()
+            ex.submit("Get Master IP", self.CmdKubectl.get_master_ip)
+            ex.submit("Get Ingress IPs", self.CmdKubectl.get_ingress_ips)
+            ex.gather()
+
+    def prepare_stage(self, stage):
+        # render every element and check it parses as kubernetes objects
+        diskless = self.settings.args.diskless
+        prepared = {}
+        failed = []
+        for element in self.settings.elements[stage] or []:
+            item = Struct(**element)
+            try:
+                if not element.get("name"):
+                    raise KeyError("element has no name")
+                if not hasattr(item, "template"):
+                    raise KeyError("element has no template")
+                rendered = self.localtemplate.write_element(
+                    item, save=not diskless or self.settings.args.keep_rendered, keep=True)
+                for doc in yaml.safe_load_all(rendered.data):
+                    if doc is not None and not (isinstance(doc, dict) and doc.get("apiVersion") and doc.get("kind")):
+                        raise ValueError("document without apiVersion and kind")
+                prepared[item.name] = rendered
+            except Exception as e:
+                failed.append((element.get("name") or element.get("template") or "-", "{0}: {1}".format(type(e).__name__, e)))
+        for name, error in failed:
+            Static.msg_bold("FAIL {0} {1}".format(stage, name), error)
+        if failed:
+            raise SystemExit(32)
+        Static.msg("Rendered {0} elements of stage".format(len(prepared)), stage)
+        self.prepared[stage] = prepared
+
+    def apply_stage(self, stage):
+        Static.figletcyber('ELEMENTS {0}'.format(stage.upper()))
+        self.rendered = self.prepared.pop(stage, {})
+        if self.settings.args.batch:
+            self.install_batch(self.settings.elements[stage] or [])
+        else:
+            self.install_graph(self.settings.elements[stage] or [])
+
+    def render(self, item):
+        # the prepared render when there is one, else render now
+        rendered = self.rendered.pop(item.name, None)
+        if rendered is None:
+            diskless = self.settings.args.diskless
+            rendered = self.localtemplate.write_element(
+                item, save=not diskless or self.settings.args.keep_rendered, keep=True)
+        return rendered
+
+    def element_graph(self, elements):
+        # element name -> names it waits for. without depends_on an element
+        # waits for the one listed before it, like the old sequential
+        # install. elements with a taint hook are barriers: they wait for
+        # everything before them and everything after waits for them.
+        graph = collections.OrderedDict()
+        barrier = None
+        for element in elements:
+            name = element.get("name")
+            if name in graph:
+                Static.msg_bold("Element listed twice in stage", name)
+                raise SystemExit(32)
+
+            if element.get("taint"):
+                after = set(graph)
+            elif "depends_on" in element:
+                after = element["depends_on"] or []
+                if isinstance(after, basestring):
+                    after = [after]
+                for dep in after:
+                    if dep not in graph:
+                        Static.msg_bold("{0} depends_on {1}".format(name, dep),
+                                        "not an element listed before it in this stage")
+                        raise SystemExit(32)
+                after = set(after)
+                if barrier:
+                    after.add(barrier)
+            else:
+                after = set(list(graph)[-1:])
+
+            graph[name] = after
+            if element.get("taint"):
+                barrier = name
+        return graph
+
+    def install_graph(self, elements, width=None):
+        # independent elements are applied side by side, at most width
+        # (default -j) at once
+        graph = self.element_graph(elements)
+        # taint hooks bracket their whole segment: they run when anything in
+        # it changed, whether or not the element carrying them did
+        self.hooks = {}
+        self.retaint = False
+        for segment in self.element_segments(elements):
+            items = [Struct(**element) for element in segment]
+            if not [item for item in items if self.changed(item)]:
+                continue
+            first, last = items[0], items[-1]
+            if self.taint_hook(first, "before") == 'master-remove-all':
+                self.hooks.setdefault(first.name, set()).add("before")
+                if self.taint_hook(last, "after") == 'master-add-noschedule':
+                    self.hooks[first.name].add("retaint")
+            if self.taint_hook(last, "after") == 'master-add-noschedule':
+                self.hooks.setdefault(last.name, set()).add("after")
+
+        ex = Executor(width)
+        for element in elements:
+            ex.submit_after(element["name"], graph[element["name"]], self.create_stage, element)
+        self.ready = []
+        try:
+            ex.gather()
+        except BaseException:
+            # a failed segment must not leave the master schedulable
+            if self.retaint:
+                self.CmdKubectl.taint_add_to_master_noschedule()
+            raise
+        finally:
+            if self.ready:
+                Readiness.report(self.ready)
+
+    def changed(self, item):
+        # rendered now and kept for create_stage
+        rendered = self.render(item)
+        self.rendered[item.name] = rendered
+        return self.settings.args.force or not self.applycache.unchanged(item.name, rendered.digest)
 
-        self.CmdKubectl.get_master_ip()
-        self.CmdKubectl.get_ingress_ips()
+    @staticmethod
+    def taint_hook(item, when):
+        return (getattr(item, "taint", None) or {}).get(when)
 
-        for element in self.settings.elements[stage]:
-            self.create_stage(element)
+    def element_segments(self, elements):
+        # runs of elements that can go out in one apply. a taint before hook
+        # starts a new segment, a taint after hook ends one.
+        segments = [[]]
+        for element in elements:
+            taint = element.get("taint") or {}
+            if "before" in taint and segments[-1]:
+                segments.append([])
+            segments[-1].append(element)
+            if "after" in taint:
+                segments.append([])
+        return [segment for segment in segments if segment]
+
+    @staticmethod
+    def document(data):
+        # every template starts a new yaml document in a batch
+        data = data.rstrip("\n") + "\n"
+        return data if data.startswith("---") else "---\n" + data
+
+    def install_batch(self, elements):
+        # one multi-document apply per segment instead of one per element
+        self.element_graph(elements)
+        self.ready = []
+        try:
+            for segment in self.element_segments(elements):
+                self.apply_segment([Struct(**element) for element in segment])
+        finally:
+            if self.ready:
+                Readiness.report(self.ready)
+
+    def apply_segment(self, items):
+        changed = []
+        for item in items:
+            rendered = self.render(item)
+            if not self.settings.args.force and self.applycache.unchanged(item.name, rendered.digest):
+                Static.msg("Unchanged since last apply, skipping", item.name)
+                self.ready.append(ReadyResult(item.name, state="unchanged"))
+                continue
+            self.applycache.forget(item.name)
+            changed.append((item, rendered))
+        if not changed:
+            return
+
+        first, last = items[0], items[-1]
+        retaint = self.taint_hook(last, "after") == 'master-add-noschedule'
+        untainted = False
+        if self.taint_hook(first, "before") == 'master-remove-all':
+            self.CmdKubectl.taint_remove_from_master()
+            untainted = True
+
+        try:
+            names = ", ".join(item.name for item, rendered in changed)
+            data = "".join(self.document(rendered.data) for item, rendered in changed)
+            self.CmdKubectl.apply_batch(names, data)
+
+            # the whole segment has to be scheduled before the master is tainted again
+            ex = Executor(len(changed))
+            for item, rendered in changed:
+                timeout = 0 if self.settings.args.no_wait else getattr(item, "ready_timeout", None)
+                ex.submit(item.name, self.readiness.wait, item.name, rendered.data, timeout)
+            results = ex.gather()
+            self.ready.extend(results)
+
+            failed = [r for r in results if r.state in ("TIMEOUT", "FAIL")]
+            for r in failed:
+                Static.msg_bold("{0} NOT READY".format(r.state), "{0}: {1}".format(r.element, r.detail))
+            if failed:
+                raise SystemExit(32)
+        except BaseException:
+            # a failed segment must not leave the master schedulable
+            if untainted and retaint:
+                self.CmdKubectl.taint_add_to_master_noschedule()
+            raise
+
+        if retaint:
+            self.CmdKubectl.wait_until_kube_system_ready()
+            self.CmdKubectl.taint_add_to_master_noschedule()
+
+        for item, rendered in changed:
+            self.applycache.store(item.name, rendered.digest)
+        Static.echo()
 
     def create_stage(self, stage):
         element_item = Struct(**stage)
-        self.localtemplate.generate_template_element(element_item)
+        # diskless applies pipe the rendered bytes to kubectl, the file in
+        # ~/.madcore/rendered is only written with --keep-rendered
+        diskless = self.settings.args.diskless
+        rendered = self.render(element_item)
+        digest = rendered.digest
+        hooks = self.hooks.get(element_item.name, ())
+
+        # before add taint, decided for the whole segment by install_graph
+        if "before" in hooks:
+            self.CmdKubectl.taint_remove_from_master()
+            self.retaint = "retaint" in hooks
+
+        if not self.settings.args.force and self.applycache.unchanged(element_item.name, digest):
+            Static.msg("Unchanged since last apply, skipping", element_item.name)
+            self.ready.append(ReadyResult(element_item.name, state="unchanged"))
+        else:
+            # a failed apply must not leave the previous hash behind
+            self.applycache.forget(element_item.name)
+
+            # process component
+            self.CmdKubectl.apply(element_item, rendered.data if diskless else None)
+
+            # ready_timeout: seconds, 0 applies without waiting
+            timeout = 0 if self.settings.args.no_wait else getattr(element_item, "ready_timeout", None)
+            result = self.readiness.wait(element_item.name, rendered.data, timeout)
+            self.ready.append(result)
+            if result.state in ("TIMEOUT", "FAIL"):
+                Static.msg_bold("{0} NOT READY".format(result.state), "{0}: {1}".format(element_item.name, result.detail))
+                raise SystemExit(32)
+            self.applycache.store(element_item.name, digest)
+
+        # after add taint, once the pods of the segment are scheduled
+        if "after" in hooks:
+            self.CmdKubectl.wait_until_kube_system_ready()
+            self.CmdKubectl.taint_add_to_master_noschedule()
+            self.retaint = False
+        Static.echo()
+
+    def render_stages(self, stages=None, processes=None):
+        global render_settings, render_template
+        stages = stages or list(self.settings.elements)
+        for stage in stages:
+            if stage not in self.settings.elements:
+                Static.msg_bold("Stage not found in clusterfile", stage)
+                raise SystemExit(32)
 
-        # before add taint
-        if hasattr(element_item, "taint"):
-            if "before" in element_item.taint:
-                if element_item.taint["before"] == 'master-remove-all':
-                    self.CmdKubectl.taint_remove_from_master()
+        jobs = [(stage, element) for stage in stages for element in self.settings.elements[stage] or []]
+        Static.msg("Rendering {0} templates from stages".format(len(jobs)), ", ".join(stages))
 
-        # process component
-        self.CmdKubectl.apply(element_item)
+        start = time.time()
+        render_settings = self.settings
+        # filter config errors exit here, where they can be printed; the
+        # workers inherit the built chain
+        for stage, element in jobs:
+            self.localtemplate.filter_chain(Struct(**element))
+        render_template = self.localtemplate
+        # nothing may sit in the log queue while we fork
+        Log.flush()
+        pool = multiprocessing.Pool(processes)
+        try:
+            # get with a timeout so ctrl-c reaches the parent
+            results = pool.map_async(render_job, jobs).get(86400)
+        finally:
+            pool.terminate()
+            pool.join()
+        elapsed = time.time() - start
 
-        # after add taint
-        if hasattr(element_item, "taint"):
-            if "after" in element_item.taint:
-                if element_item.taint["after"] == 'master-add-noschedule':
-                    self.CmdKubectl.wait_until_kube_system_ready()
-                    self.CmdKubectl.taint_add_to_master_noschedule()
+        table = PrettyTable(["STAGE", "ELEMENT", "TEMPLATE", "RENDER ms", "BYTES", "STATE"])
+        table.border = False
+        table.align = "l"
+        failed = []
+        for stage, name, template, seconds, size, error in results:
+            table.add_row([stage, name, template, "{0:.1f}".format(seconds * 1000), size if size is not None else "-", "FAIL" if error else "ok"])
+            if error:
+                failed.append((template, error))
+        Static.echo(table.get_string())
+        Static.echo()
 
-        time.sleep(3)
-        print
+        total = sum(r[4] for r in results if r[4] is not None)
+        Static.msg("Rendered {0} templates, {1} bytes in {2:.2f}s to".format(len(results) - len(failed), total, elapsed),
+                   self.settings.folder_user_populated)
 
+        for template, error in failed:
+            Static.msg_bold("FAIL {0}".format(template), error)
+        if failed:
+            raise SystemExit(32)
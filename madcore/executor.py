@@ -0,0 +1,145 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from log import Log
+import sys
+import threading
+
+
+class Task(object):
+    name = None
+    fn = None
+    args = None
+    result = None
+    error = None
+    # log label of the submitting thread, carried over to the worker
+    label = None
+    # names of tasks that have to finish first
+    after = frozenset()
+
+    def __init__(self, name, fn, args, after=()):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.after = frozenset(after)
+        self.label = Log.label()
+
+
+class Executor(object):
+    # bounded thread pool; most of our time is spent waiting on the api server,
+    # not on the cpu, so threads are good enough
+    default_workers = 8
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or Executor.default_workers
+        self.tasks = []
+
+    def submit(self, name, fn, *args):
+        task = Task(name, fn, args)
+        self.tasks.append(task)
+        return task
+
+    def submit_after(self, name, after, fn, *args):
+        # task that starts only once the tasks named in after are done
+        task = Task(name, fn, args, after)
+        self.tasks.append(task)
+        return task
+
+    def gather(self):
+        # run all submitted tasks, return results in submission order.
+        # a task starts when everything it runs after is done, in
+        # submission order otherwise. first failure stops dispatch of
+        # anything not yet started and is re-raised here once the running
+        # tasks are finished.
+        tasks, self.tasks = self.tasks, []
+        if not tasks:
+            return []
+
+        Executor.check_order(tasks)
+        pending = list(tasks)
+        done = set()
+        failed = threading.Event()
+        changed = threading.Condition()
+
+        def next_task():
+            with changed:
+                while pending and not failed.is_set():
+                    for task in pending:
+                        if task.after <= done:
+                            pending.remove(task)
+                            return task
+                    changed.wait(0.1)
+                return None
+
+        def worker():
+            while True:
+                task = next_task()
+                if task is None:
+                    return
+                Log.set_label(task.label)
+                try:
+                    task.result = task.fn(*task.args)
+                except BaseException:
+                    task.error = sys.exc_info()
+                    failed.set()
+                with changed:
+                    done.add(task.name)
+                    changed.notify_all()
+
+        threads = []
+        for i in range(min(self.max_workers, len(tasks))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        # join with timeout so ctrl-c still reaches the main thread
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.1)
+
+        for task in tasks:
+            if task.error:
+                raise task.error[0], task.error[1], task.error[2]
+
+        return [task.result for task in tasks]
+
+    @staticmethod
+    def check_order(tasks):
+        # every task must only run after tasks submitted before it, which
+        # also rules out cycles
+        seen = set()
+        for task in tasks:
+            missing = task.after - seen
+            if missing:
+                raise ValueError("{0} runs after {1}, which was not submitted before it".format(
+                    task.name, ", ".join(sorted(missing))))
+            seen.add(task.name)
+
+    @staticmethod
+    def map(fn, items, max_workers=None):
+        ex = Executor(max_workers)
+        for item in items:
+            ex.submit(str(item), fn, item)
+        return ex.gather()
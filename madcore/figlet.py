@@ -0,0 +1,138 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import threading
+
+
+class FigletFont(object):
+    # minimal flf2 reader/renderer, full width layout only (what the bundled
+    # cybermedium font declares). replaces forking the figlet binary.
+
+    # the german characters that follow ascii in every flf2 font
+    deutsch = [196, 214, 220, 228, 246, 252, 223]
+
+    fonts = {}
+    lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.glyphs = {}
+        self.rendered = {}
+        self.load()
+
+    @staticmethod
+    def cyber():
+        return FigletFont.get(os.path.join(os.path.dirname(os.path.realpath(__file__)), "cybermedium.flf"))
+
+    @staticmethod
+    def get(path):
+        # fonts are parsed once per process, on first use
+        with FigletFont.lock:
+            if path not in FigletFont.fonts:
+                FigletFont.fonts[path] = FigletFont(path)
+            return FigletFont.fonts[path]
+
+    def load(self):
+        with open(self.path) as f:
+            lines = f.read().decode("latin-1").splitlines()
+
+        header = lines[0].split()
+        self.hardblank = header[0][-1]
+        self.height = int(header[1])
+        comment_lines = int(header[5])
+
+        codes = range(32, 127) + FigletFont.deutsch
+        pos = 1 + comment_lines
+        for code in codes:
+            if pos + self.height > len(lines):
+                break
+            self.glyphs[unichr(code)] = self.read_glyph(lines[pos:pos + self.height])
+            pos += self.height
+
+        # code tagged characters: "<code> [comment]" then the glyph
+        while pos + self.height < len(lines):
+            tag = lines[pos].split()
+            pos += 1
+            if not tag:
+                continue
+            try:
+                code = int(tag[0], 0)
+            except ValueError:
+                break
+            if code >= 0:
+                self.glyphs[unichr(code)] = self.read_glyph(lines[pos:pos + self.height])
+            pos += self.height
+
+    def read_glyph(self, rows):
+        # every row ends with one or two endmark characters
+        glyph = []
+        for row in rows:
+            row = row.rstrip()
+            if row:
+                row = row.rstrip(row[-1])
+            glyph.append(row)
+        width = max(len(row) for row in glyph)
+        return [row.ljust(width) for row in glyph]
+
+    def render(self, msg, width=80):
+        key = (msg, width)
+        if key not in self.rendered:
+            self.rendered[key] = self.layout(msg, width)
+        return self.rendered[key]
+
+    def layout(self, msg, width):
+        # word wrap like figlet: output lines stay under width columns
+        if not isinstance(msg, unicode):
+            msg = msg.decode("utf-8", "replace")
+        limit = width - 1
+        space = self.glyphs.get(u" ", [""] * self.height)
+
+        blocks = []
+        line = []
+        line_width = 0
+        for word in msg.split():
+            glyphs = [self.glyphs[c] for c in word if c in self.glyphs]
+            word_width = sum(len(g[0]) for g in glyphs)
+            if line and line_width + len(space[0]) + word_width > limit:
+                blocks.append(line)
+                line, line_width = [], 0
+            if line:
+                line.append(space)
+                line_width += len(space[0])
+            for glyph in glyphs:
+                # words wider than the terminal get broken per character
+                if line and line_width + len(glyph[0]) > limit:
+                    blocks.append(line)
+                    line, line_width = [], 0
+                line.append(glyph)
+                line_width += len(glyph[0])
+        if line or not blocks:
+            blocks.append(line)
+
+        out = []
+        for block in blocks:
+            for row in range(self.height):
+                out.append(u"".join(glyph[row] for glyph in block).replace(self.hardblank, u" "))
+        return u"\n".join(out).encode("utf-8") + "\n"
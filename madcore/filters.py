@@ -0,0 +1,164 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from static import Static
+import collections
+import importlib
+import re
+
+
+class Filters(object):
+    # post-render filters. each one is a generator over the lines (or the
+    # yaml documents) of a rendered manifest, chained between jinja and the
+    # output file, so no manifest is ever built up in memory.
+    #
+    # register a factory with @Filters.register("name"). the factory gets the
+    # settings and the filter config from the clusterfile and returns the
+    # generator function, or None when the filter doesn't apply.
+    #
+    #   filters:
+    #       - name: image-registry
+    #         registry: registry.example.com:5000
+    #       - module: mycompany.madcore_filters   # imported, may register more
+    #         name: my-filter
+    #
+    # elements can list extra filters the same way under their own filters: key.
+
+    registry = collections.OrderedDict()
+    # applied to every manifest without being configured
+    builtin = []
+
+    @staticmethod
+    def register(name, documents=False, builtin=False):
+        def wrap(factory):
+            Filters.registry[name] = (factory, documents)
+            if builtin:
+                Filters.builtin.append(name)
+            return factory
+        return wrap
+
+    @staticmethod
+    def build(settings, configs, builtin=True):
+        # builtin=False for element filters, which extend a chain that
+        # already has the builtins
+        chain = []
+        builtins = [{"name": name} for name in Filters.builtin] if builtin else []
+        for config in builtins + list(configs or []):
+            if config.get("module"):
+                importlib.import_module(config["module"])
+            name = config.get("name")
+            if name not in Filters.registry:
+                Static.msg_bold("Unknown template filter", name)
+                raise SystemExit(32)
+            factory, documents = Filters.registry[name]
+            fn = factory(settings, config)
+            if fn is not None:
+                chain.append((fn, documents))
+        return chain
+
+    @staticmethod
+    def apply(chain, lines):
+        for fn, documents in chain:
+            if documents:
+                lines = Filters.join_documents(fn(Filters.split_documents(lines)))
+            else:
+                lines = fn(lines)
+        return lines
+
+    @staticmethod
+    def lines(chunks):
+        # jinja yields chunks of any size, filters want whole lines
+        pending = u""
+        for chunk in chunks:
+            pending += chunk
+            if u"\n" not in chunk:
+                continue
+            parts = pending.split(u"\n")
+            pending = parts.pop()
+            for part in parts:
+                yield part + u"\n"
+        if pending:
+            yield pending
+
+    @staticmethod
+    def split_documents(lines):
+        # lists of lines, one per yaml document, separators are kept
+        doc = []
+        for line in lines:
+            if line.startswith(u"---") and doc:
+                yield doc
+                doc = []
+            doc.append(line)
+        if doc:
+            yield doc
+
+    @staticmethod
+    def join_documents(docs):
+        for doc in docs:
+            for line in doc:
+                yield line
+
+
+@Filters.register("minikube-nodeselector", builtin=True)
+def minikube_nodeselector(settings, config):
+    # minikube has one node and no kops instance groups
+    if settings.provision.cloud != "minikube":
+        return None
+
+    def run(lines):
+        for line in lines:
+            if u"kops.k8s.io/instancegroup:" in line:
+                number_of_leading_spaces = len(line) - len(line.lstrip())
+                line = u"{0}kubernetes.io/hostname: minikube\n".format(u' ' * number_of_leading_spaces)
+            yield line
+    return run
+
+
+@Filters.register("image-registry")
+def image_registry(settings, config):
+    # pull images through a mirror: images without a registry, or from one
+    # of the "from" registries, get "registry" as their registry instead
+    registry = config.get("registry", "").rstrip("/")
+    if not registry:
+        Static.msg_bold("image-registry filter needs", "registry")
+        raise SystemExit(32)
+    sources = set(config.get("from") or ["docker.io", "index.docker.io", "registry-1.docker.io"])
+    pattern = re.compile(r"^(\s*-?\s*image:\s*)([\"']?)([^\s\"']+)\2(\s*)$")
+
+    def rewrite(image):
+        head, _, rest = image.partition("/")
+        if rest and ("." in head or ":" in head or head == "localhost"):
+            if head not in sources:
+                return image
+            image = rest
+        return u"{0}/{1}".format(registry, image)
+
+    def run(lines):
+        for line in lines:
+            match = pattern.match(line)
+            if match:
+                prefix, quote, image, tail = match.groups()
+                line = u"{0}{1}{2}{1}{3}".format(prefix, quote, rewrite(image), tail)
+            yield line
+    return run
@@ -0,0 +1,118 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from static import Static
+from executor import Executor
+from log import Log
+from prettytable import PrettyTable
+import cmdkops
+import cmdkubectl
+import elements
+import settings
+import os
+import time
+
+
+class FleetResult(object):
+    clusterfile = None
+    cluster = None
+    context = None
+    ok = False
+    elapsed = None
+    detail = ""
+
+    def __init__(self, clusterfile):
+        self.clusterfile = clusterfile
+        self.cluster = os.path.basename(clusterfile)
+
+
+class Fleet(object):
+    # one action over many clusters at once. each cluster gets its own
+    # Settings and is pinned to its own kubeconfig context, the global
+    # current-context and settings.yaml are left alone.
+
+    STATUS = "status"
+    VALIDATE = "validate"
+    INSTALL = "install"
+
+    def __init__(self, args, clusterfiles):
+        self.args = args
+        self.clusterfiles = clusterfiles
+
+    def run(self, action, stages=None):
+        # stages: element stages for INSTALL
+        stage = ",".join(stages or [])
+        Static.figletcyber("FLEET {0}".format((stage or action).upper()))
+        Static.msg("Clusters", ", ".join(self.clusterfiles))
+
+        results = Executor.map(lambda clusterfile: self.run_cluster(clusterfile, action, stages),
+                               self.clusterfiles, len(self.clusterfiles))
+        Log.flush()
+        self.report(action, stage, results)
+        if not all(r.ok for r in results):
+            raise SystemExit(32)
+        return results
+
+    def run_cluster(self, clusterfile, action, stages):
+        result = FleetResult(clusterfile)
+        start = time.time()
+        try:
+            sett = settings.Settings(self.args)
+            sett.use_clusterfile(clusterfile)
+            result.cluster = sett.cluster.name
+            Log.set_label(result.cluster)
+            # clusters render the same template names at the same time, each
+            # into its own folder
+            sett.folder_user_populated = os.path.join(sett.folder_user_populated, result.cluster)
+            sett.mkdir_p(sett.folder_user_populated)
+
+            kc = cmdkubectl.CmdKubectl(sett)
+            sett.kube_context = result.context = kc.context_name()
+
+            if action == Fleet.STATUS:
+                kc.get_status()
+            elif action == Fleet.VALIDATE:
+                cmdkops.CmdKops(sett).validate_cluster()
+            elif action == Fleet.INSTALL:
+                elements.Elements(sett).install_stages(stages)
+            result.ok = True
+        except SystemExit as e:
+            result.detail = Log.errors.get(result.cluster) or "exit {0}".format(e.code)
+        except Exception as e:
+            result.detail = "{0}: {1}".format(type(e).__name__, e)
+        finally:
+            Log.set_label(None)
+        result.elapsed = time.time() - start
+        return result
+
+    def report(self, action, stage, results):
+        table = PrettyTable(["CLUSTER", "CLUSTERFILE", "CONTEXT", "ACTION", "STATE", "TIME s", "DETAIL"])
+        table.border = False
+        table.align = "l"
+        for r in results:
+            table.add_row([r.cluster, r.clusterfile, r.context or "-", stage or action,
+                           "ok" if r.ok else "FAIL", "{0:.1f}".format(r.elapsed), r.detail[:80]])
+        Static.figletcyber("FLEET REPORT")
+        Static.echo(table.get_string())
+        Static.echo()
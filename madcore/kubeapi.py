@@ -0,0 +1,273 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from executor import Executor
+from tracer import Tracer
+from os.path import expanduser
+import atexit
+import base64
+import json
+import os
+import tempfile
+import threading
+import urllib
+import urllib3
+import yaml
+
+
+class KubeApiError(Exception):
+
+    def __init__(self, status, message):
+        Exception.__init__(self, "{0}: {1}".format(status, message))
+        self.status = status
+        self.message = message
+
+
+class KubeApi(object):
+    # in-process kubernetes api client. kubeconfig is read once and all
+    # requests share one keep-alive connection pool.
+
+    # one client per context, shared by every CmdKubectl in the process
+    clients = {}
+    lock = threading.Lock()
+
+    def __init__(self, context=None, kubeconfig=None):
+        self.tempfiles = []
+        self.resources = {}
+        self.load_kubeconfig(context, kubeconfig)
+
+        self.http = urllib3.PoolManager(
+            num_pools=1,
+            maxsize=Executor.default_workers,
+            block=False,
+            retries=False,
+            timeout=urllib3.Timeout(connect=5.0, read=60.0),
+            **self.tls
+        )
+
+    @staticmethod
+    def shared(context=None):
+        with KubeApi.lock:
+            if context not in KubeApi.clients:
+                KubeApi.clients[context] = KubeApi(context)
+            return KubeApi.clients[context]
+
+    def load_kubeconfig(self, context, kubeconfig):
+        path = kubeconfig or os.environ.get("KUBECONFIG", "").split(os.pathsep)[0] or \
+            os.path.join(expanduser("~"), ".kube", "config")
+        if not os.path.isfile(path):
+            raise KubeApiError("kubeconfig", "{0} not found".format(path))
+
+        with open(path) as f:
+            config = yaml.safe_load(f)
+
+        def find(section, name):
+            for entry in config.get(section) or []:
+                if entry["name"] == name:
+                    return entry[section[:-1]]
+            raise KubeApiError("kubeconfig", "{0} {1} not found in {2}".format(section[:-1], name, path))
+
+        self.context = context or config.get("current-context")
+        ctx = find("contexts", self.context)
+        cluster = find("clusters", ctx["cluster"])
+        user = find("users", ctx["user"]) if ctx.get("user") else {}
+
+        self.server = cluster["server"].rstrip("/")
+        self.headers = {"Accept": "application/json", "User-Agent": "madcore"}
+        self.tls = {}
+
+        if self.server.startswith("https"):
+            if cluster.get("insecure-skip-tls-verify"):
+                self.tls["cert_reqs"] = "CERT_NONE"
+                urllib3.disable_warnings()
+            else:
+                self.tls["cert_reqs"] = "CERT_REQUIRED"
+                self.tls["ca_certs"] = self.credential_file(cluster, "certificate-authority")
+            if user.get("client-certificate") or user.get("client-certificate-data"):
+                self.tls["cert_file"] = self.credential_file(user, "client-certificate")
+                self.tls["key_file"] = self.credential_file(user, "client-key")
+
+        if user.get("token"):
+            self.headers["Authorization"] = "Bearer {0}".format(user["token"])
+        elif user.get("tokenFile"):
+            with open(user["tokenFile"]) as f:
+                self.headers["Authorization"] = "Bearer {0}".format(f.read().strip())
+        elif user.get("username"):
+            self.headers["Authorization"] = "Basic {0}".format(
+                base64.b64encode("{0}:{1}".format(user["username"], user.get("password", ""))))
+        elif user.get("exec") or user.get("auth-provider"):
+            raise KubeApiError("kubeconfig", "exec/auth-provider credentials are not supported, use kubectl")
+
+    def credential_file(self, section, key):
+        # ssl wants files, *-data entries are written to private temp files
+        if section.get(key):
+            return section[key]
+        if not section.get(key + "-data"):
+            return None
+        fd, path = tempfile.mkstemp(prefix="madcore-kubeapi-")
+        os.write(fd, base64.b64decode(section[key + "-data"]))
+        os.close(fd)
+        if not self.tempfiles:
+            atexit.register(self.cleanup)
+        self.tempfiles.append(path)
+        return path
+
+    def cleanup(self):
+        for path in self.tempfiles:
+            if os.path.exists(path):
+                os.remove(path)
+        self.tempfiles = []
+
+    def request(self, method, path, body=None, content_type="application/json", params=None):
+        url = self.server + path
+        if params:
+            url += "?" + urllib.urlencode(params)
+
+        headers = dict(self.headers)
+        if body is not None:
+            headers["Content-Type"] = content_type
+            if not isinstance(body, basestring):
+                body = json.dumps(body)
+
+        span = Tracer.now() if Tracer.path else None
+        try:
+            response = self.http.request(method, url, body=body, headers=headers, preload_content=True)
+        except urllib3.exceptions.HTTPError as e:
+            raise KubeApiError("connection", str(e))
+        if span is not None:
+            Tracer.add({"name": "{0} {1}".format(method, path), "cat": "api", "ph": "X", "ts": span,
+                        "dur": Tracer.now() - span, "args": {"status": response.status, "bytes": len(response.data)}})
+
+        data = response.data
+        if response.status >= 400:
+            message = data
+            try:
+                message = json.loads(data).get("message", data)
+            except ValueError:
+                pass
+            raise KubeApiError(response.status, message)
+
+        return json.loads(data) if data else None
+
+    def get(self, path, **params):
+        return self.request("GET", path, params=params)
+
+    def list(self, path, **params):
+        return self.get(path, **params).get("items") or []
+
+    def watch(self, path, timeout, **params):
+        # yields (type, object) per event on a collection until the server
+        # closes the watch, at the latest after timeout seconds
+        params = dict(params, watch="true", timeoutSeconds=int(timeout))
+        url = "{0}{1}?{2}".format(self.server, path, urllib.urlencode(params))
+        try:
+            response = self.http.request("GET", url, headers=self.headers, preload_content=False,
+                                         timeout=urllib3.Timeout(connect=5.0, read=timeout + 10))
+        except urllib3.exceptions.HTTPError as e:
+            raise KubeApiError("connection", str(e))
+
+        try:
+            if response.status >= 400:
+                raise KubeApiError(response.status, response.read())
+            pending = ""
+            for chunk in response.stream(4096):
+                pending += chunk
+                while "\n" in pending:
+                    line, pending = pending.split("\n", 1)
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    if event["type"] == "ERROR":
+                        raise KubeApiError(event["object"].get("code"), event["object"].get("message"))
+                    yield event["type"], event["object"]
+        except urllib3.exceptions.HTTPError as e:
+            raise KubeApiError("connection", str(e))
+        finally:
+            # a watch left early can't go back to the pool half read
+            response.close()
+
+    def patch(self, path, body, patch_type="strategic", **params):
+        content_type = {
+            "strategic": "application/strategic-merge-patch+json",
+            "merge": "application/merge-patch+json",
+            "json": "application/json-patch+json",
+        }[patch_type]
+        return self.request("PATCH", path, body=body, content_type=content_type, params=params)
+
+    def resource_path(self, api_version, kind, namespace=None, name=None):
+        # resolve kind to its plural through discovery, cached per group/version
+        if api_version not in self.resources:
+            base = "/api/v1" if api_version == "v1" else "/apis/{0}".format(api_version)
+            self.resources[api_version] = (base, dict(
+                (r["kind"], r) for r in self.get(base)["resources"] if "/" not in r["name"]))
+
+        base, kinds = self.resources[api_version]
+        if kind not in kinds:
+            raise KubeApiError(404, "no resource {0} in {1}".format(kind, api_version))
+
+        resource = kinds[kind]
+        path = base
+        if resource["namespaced"]:
+            path += "/namespaces/{0}".format(namespace or "default")
+        path += "/" + resource["name"]
+        if name:
+            path += "/" + name
+        return path
+
+    def apply(self, manifest):
+        # create, or patch the whole object when it already exists. works on
+        # clusters older than server-side apply (1.16)
+        metadata = manifest.get("metadata") or {}
+        collection = self.resource_path(manifest["apiVersion"], manifest["kind"], metadata.get("namespace"))
+        path = "{0}/{1}".format(collection, metadata["name"])
+
+        try:
+            self.get(path)
+        except KubeApiError as e:
+            if e.status != 404:
+                raise
+            return self.request("POST", collection, body=manifest)
+
+        try:
+            return self.patch(path, manifest, "strategic")
+        except KubeApiError as e:
+            # custom resources don't support strategic merge
+            if e.status != 415:
+                raise
+            return self.patch(path, manifest, "merge")
+
+    def apply_yaml(self, text):
+        return [self.apply(doc) for doc in yaml.safe_load_all(text) if doc]
+
+    def server_side_apply(self, manifest):
+        # the api server merges and tracks field ownership (1.16+), one
+        # request per object whether it exists or not
+        metadata = manifest.get("metadata") or {}
+        collection = self.resource_path(manifest["apiVersion"], manifest["kind"], metadata.get("namespace"))
+        return self.request("PATCH", "{0}/{1}".format(collection, metadata["name"]), body=manifest,
+                            content_type="application/apply-patch+yaml",
+                            params={"fieldManager": "madcore", "force": "true"})
+
+    def server_side_apply_yaml(self, text):
+        return [self.server_side_apply(doc) for doc in yaml.safe_load_all(text) if doc]
@@ -22,8 +22,12 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from jinja2 import Environment, PackageLoader, FileSystemLoader
+from jinja2 import Environment, PackageLoader, FileSystemLoader, FileSystemBytecodeCache
+from jinja2 import ChoiceLoader, ModuleLoader, TemplateNotFound
+from filters import Filters
+import hashlib
 import os
+import tempfile
 from prettytable import PrettyTable
 import static
 
@@ -33,55 +37,134 @@ class Struct:
         self.__dict__.update(entries)
 
 
+class Rendered(object):
+    # populated file, None when it was only rendered into memory
+    path = None
+    # rendered bytes, None unless kept in memory
+    data = None
+    digest = None
+    size = 0
+
+
+class PrecompiledLoader(ModuleLoader):
+    # templates compiled by setup.py build_py. a template whose source is
+    # newer than its module (edited checkout) is left to the next loader.
+
+    def __init__(self, path, source):
+        ModuleLoader.__init__(self, path)
+        self.path = path
+        self.source = source
+
+    def load(self, environment, name, globals=None):
+        key = self.get_template_key(name)
+        compiled = [os.path.join(self.path, key + ext) for ext in (".pyc", ".py")]
+        compiled = [p for p in compiled if os.path.exists(p)]
+        source = os.path.join(self.source, name)
+        if not compiled or (os.path.exists(source) and
+                            os.path.getmtime(source) > os.path.getmtime(compiled[0])):
+            raise TemplateNotFound(name)
+        return ModuleLoader.load(self, environment, name, globals)
+
+
 class LocalTemplate(object):
 
     settings = None
+    env = None
+    chain = None
 
     def __init__(self, in_settings):
         self.settings = in_settings
 
-    def generate_template(self, name):
+        # one environment for every render, compiled templates are kept in
+        # ~/.madcore/cache/jinja and reused across runs. jinja checks the
+        # source checksum, so edited templates are recompiled.
+        bytecode_folder = os.path.join(self.settings.folder_user_cache, "jinja")
+        if not os.path.exists(bytecode_folder):
+            self.settings.mkdir_p(bytecode_folder)
+
+        # user overrides in ~/.madcore/templates, then the bundle compiled at
+        # install time, then the template sources
+        loaders = [FileSystemLoader(self.settings.folder_user_templates)]
+        if os.path.isdir(self.settings.folder_app_templates_compiled):
+            loaders.append(PrecompiledLoader(self.settings.folder_app_templates_compiled,
+                                             self.settings.folder_app_templates))
+        loaders.append(FileSystemLoader(self.settings.folder_app_templates))
 
         #env = Environment(loader=PackageLoader('localtemplate', 'templates'))
-        env = Environment(loader=FileSystemLoader(self.settings.folder_app_templates))
-        template = env.get_template(name)
-        rendered = template.render(settings=self.settings)
+        self.env = Environment(
+            loader=ChoiceLoader(loaders),
+            bytecode_cache=FileSystemBytecodeCache(bytecode_folder),
+        )
+
+    def render(self, name, **context):
+        return self.env.get_template(name).render(settings=self.settings, **context)
 
+    def save(self, name, rendered):
         template_save_path = "{0}/{1}".format(self.settings.folder_user_populated, name)
+        data = rendered.encode("UTF-8")
         with open(template_save_path, "wb") as f:
-            f.write(rendered.encode("UTF-8"))
-        f.close()
+            f.write(data)
+        return len(data)
 
-    def generate_template_node(self, file_template, file_populated, ig):
-        env = Environment(loader=FileSystemLoader(self.settings.folder_app_templates))
-        template = env.get_template(file_template)
-        rendered = template.render(ig=ig, settings=self.settings)
+    def generate_template(self, name):
+        self.save(name, self.render(name))
 
-        save_path = "{0}/{1}".format(self.settings.folder_user_populated, file_populated)
-        with open(save_path, "wb") as f:
-            f.write(rendered.encode("UTF-8"))
-        f.close()
+    def generate_template_node(self, file_template, file_populated, ig):
+        self.save(file_populated, self.render(file_template, ig=ig))
+
+    def filter_chain(self, item):
+        # clusterfile filters are built once, element filters per element
+        if self.chain is None:
+            self.chain = Filters.build(self.settings, self.settings.filters)
+        if getattr(item, "filters", None):
+            return self.chain + Filters.build(self.settings, item.filters, builtin=False)
+        return self.chain
+
+    def stream_element(self, item):
+        # rendered lines, filtered, as jinja produces them
+        template = self.env.get_template(item.template)
+        chunks = template.generate(component=item, settings=self.settings)
+        return Filters.apply(self.filter_chain(item), Filters.lines(chunks))
+
+    def render_element(self, item):
+        return u"".join(self.stream_element(item))
+
+    def write_element(self, item, save=True, keep=False):
+        # stream to the populated file when save, and into memory when keep,
+        # hashing on the way
+        rendered = Rendered()
+        digest = hashlib.sha256()
+        chunks = [] if keep else None
+        f = tmp = None
+        if save:
+            # written next to the populated file and renamed over it when
+            # complete, a failed render never leaves a truncated manifest
+            rendered.path = "{0}/{1}".format(self.settings.folder_user_populated, item.template)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(rendered.path), prefix=".render-")
+            f = os.fdopen(fd, "wb")
+        try:
+            for line in self.stream_element(item):
+                data = line.encode("UTF-8")
+                digest.update(data)
+                rendered.size += len(data)
+                if f is not None:
+                    f.write(data)
+                if keep:
+                    chunks.append(data)
+            if f is not None:
+                f.close()
+                os.chmod(tmp, static.Static.file_mode(rendered.path))
+                os.rename(tmp, rendered.path)
+        finally:
+            if f is not None and not f.closed:
+                f.close()
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+
+        rendered.digest = digest.hexdigest()
+        if keep:
+            rendered.data = "".join(chunks)
+        return rendered
 
     def generate_template_element(self, item):
-        env = Environment(loader=FileSystemLoader(self.settings.folder_app_templates))
-        template = env.get_template(item.template)
-        rendered = template.render(component=item, settings=self.settings)
-
-        if self.settings.provision.cloud == "minikube":
-            rendered = self.overwrite_nodeselector_for_minikube (rendered)
-
-        template_save_path = "{0}/{1}".format(self.settings.folder_user_populated, item.template)
-        with open(template_save_path, "wb") as f:
-            f.write(rendered.encode("UTF-8"))
-        f.close()
-
-    def overwrite_nodeselector_for_minikube(self, data):
-        out = ''
-        lines = data.split('\n')
-        for line in lines:
-            if "kops.k8s.io/instancegroup:" in line:
-                number_of_leading_spaces = len(line) - len(line.lstrip())
-                line = "{0}kubernetes.io/hostname: minikube".format(' ' * number_of_leading_spaces)
-            out += '{0}\n'.format(line)
-        return out
-
+        self.write_element(item)
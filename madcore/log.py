@@ -0,0 +1,250 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from termcolor import colored
+import atexit
+import datetime
+import json
+import sys
+import threading
+import time
+import Queue
+
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+
+LEVELS = {"debug": DEBUG, "info": INFO, "warn": WARN, "error": ERROR}
+LEVEL_NAMES = dict((v, k) for k, v in LEVELS.items())
+
+
+class Record(object):
+    # kind is "event" for msg style lines, "output" for raw text
+    kind = None
+    ts = None
+    level = None
+    service = None
+    msg = None
+    # cluster the emitting thread works on in fleet mode, else None
+    label = None
+
+    def __init__(self, kind, level, service, msg):
+        self.kind = kind
+        self.ts = time.time()
+        self.level = level
+        self.service = service
+        self.msg = msg
+        self.label = Log.label()
+
+
+def prefix_lines(label, text):
+    if not label:
+        return text
+    return "".join("[{0}] {1}".format(label, line) for line in text.splitlines(True))
+
+
+class TtyFormatter(object):
+    colors = {
+        DEBUG: ('blue', 'white', []),
+        INFO: ('yellow', 'green', []),
+        WARN: ('magenta', 'magenta', []),
+        ERROR: ('red', 'red', ['bold']),
+    }
+
+    def format(self, record):
+        if record.kind == "output":
+            return prefix_lines(record.label, record.msg)
+        service_color, msg_color, attrs = self.colors[record.level]
+        return "{0} {1} {2}{3} {4} {5}\n".format(
+            colored(str(datetime.datetime.fromtimestamp(record.ts)), 'cyan'),
+            colored(':', 'white'),
+            colored("[{0}] ".format(record.label), 'white', attrs=['bold']) if record.label else "",
+            colored(record.service, service_color),
+            colored('>>', 'white'),
+            colored(record.msg, msg_color, attrs=attrs))
+
+
+class PlainFormatter(object):
+
+    def format(self, record):
+        if record.kind == "output":
+            return prefix_lines(record.label, record.msg)
+        return "{0} : {1}{2} >> {3}\n".format(
+            datetime.datetime.fromtimestamp(record.ts),
+            "[{0}] ".format(record.label) if record.label else "", record.service, record.msg)
+
+
+class JsonFormatter(object):
+    # one json object per line, raw output is split into one record per line
+
+    def format(self, record):
+        base = {
+            "ts": datetime.datetime.utcfromtimestamp(record.ts).isoformat() + "Z",
+            "level": LEVEL_NAMES[record.level],
+        }
+        if record.label:
+            base["cluster"] = self.text(record.label)
+        if record.kind == "output":
+            out = []
+            for line in record.msg.splitlines():
+                entry = dict(base, kind="output", msg=self.text(line))
+                if record.service:
+                    entry["name"] = self.text(record.service)
+                out.append(json.dumps(entry) + "\n")
+            return "".join(out)
+        return json.dumps(dict(base, kind=record.kind, service=self.text(record.service), msg=self.text(record.msg))) + "\n"
+
+    def text(self, value):
+        if isinstance(value, str):
+            return value.decode("utf-8", "replace")
+        if isinstance(value, unicode):
+            return value
+        return unicode(value)
+
+
+class Log(object):
+    # every line madcore prints goes through here. records are queued and
+    # written by one background thread, in order, with a flush whenever the
+    # queue runs dry.
+
+    level = INFO
+    formatter = None
+    stream = sys.stdout
+    queue = Queue.Queue()
+    thread = None
+    lock = threading.Lock()
+    # per thread cluster label, see set_label
+    local = threading.local()
+    # last error message per label
+    errors = {}
+
+    @staticmethod
+    def configure(level=None, json_lines=False, stream=None):
+        if level:
+            Log.level = LEVELS[level]
+        if stream:
+            Log.stream = stream
+        if json_lines:
+            Log.formatter = JsonFormatter()
+        elif Log.stream.isatty():
+            Log.formatter = TtyFormatter()
+        else:
+            Log.formatter = PlainFormatter()
+
+    @staticmethod
+    def structured():
+        return isinstance(Log.formatter, JsonFormatter)
+
+    @staticmethod
+    def start():
+        with Log.lock:
+            if Log.thread is not None:
+                return
+            if Log.formatter is None:
+                Log.configure()
+            Log.thread = threading.Thread(target=Log.writer)
+            Log.thread.daemon = True
+            Log.thread.start()
+            atexit.register(Log.stop)
+
+    @staticmethod
+    def writer():
+        while True:
+            record = Log.queue.get()
+            if record is None:
+                try:
+                    Log.stream.flush()
+                except Exception:
+                    pass
+                Log.queue.task_done()
+                return
+            try:
+                Log.stream.write(Log.formatter.format(record))
+                if Log.queue.empty():
+                    Log.stream.flush()
+            except IOError:
+                # closed pipe, e.g. madcore | head
+                pass
+            except Exception as e:
+                # the writer must survive anything, flush() waits on it
+                Log.fallback(record, e)
+            finally:
+                Log.queue.task_done()
+
+    @staticmethod
+    def fallback(record, error):
+        try:
+            sys.__stderr__.write("log: {0}: {1}: {2!r}\n".format(type(error).__name__, record.service, record.msg))
+        except Exception:
+            pass
+
+    @staticmethod
+    def label():
+        return getattr(Log.local, "label", None)
+
+    @staticmethod
+    def set_label(label):
+        # everything this thread logs is tagged with label, fleet mode uses
+        # it to keep interleaved clusters apart
+        Log.local.label = label
+
+    @staticmethod
+    def put(record):
+        if record.level >= ERROR and record.label:
+            Log.errors[record.label] = "{0} {1}".format(record.service, record.msg)
+        # command output and reports are what was asked for, the level only
+        # filters messages about the run
+        if record.level < Log.level and record.kind != "output":
+            return
+        if Log.thread is None:
+            Log.start()
+        Log.queue.put(record)
+
+    @staticmethod
+    def event(level, service, msg):
+        Log.put(Record("event", level, service, msg))
+
+    @staticmethod
+    def phase(name):
+        Log.put(Record("phase", INFO, "PHASE", name))
+
+    @staticmethod
+    def output(text, name=None, level=INFO):
+        if text:
+            Log.put(Record("output", level, name, text))
+
+    @staticmethod
+    def flush():
+        # wait until everything queued so far is on the stream
+        if Log.thread is not None:
+            Log.queue.join()
+
+    @staticmethod
+    def stop():
+        if Log.thread is not None and Log.thread.is_alive():
+            Log.queue.put(None)
+            Log.thread.join()
+        Log.thread = None
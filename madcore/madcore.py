@@ -31,8 +31,17 @@ import cmdkops
 import elements
 import provision
 import cmdkubectl
+import prober
+import plan
+import preflight
+import fleet
 from cmd import Cmd
+from executor import Executor
 from static import Static
+from tracer import Tracer
+from replay import Replay
+from log import Log
+import log
 import pkg_resources
 from termcolor import colored
 
@@ -56,6 +65,16 @@ def get_version():
         return Cmd.local_run_get_out("get version", "git describe --tags")
 
 
+def install_stages(args):
+    # element stages selected with --install or one of the --install-* flags
+    if args.install:
+        return [stage.strip() for stage in args.install.split(",") if stage.strip()]
+    for stage in ("core", "elk", "neo4j", "kafka", "flink", "scrapy", "tron"):
+        if getattr(args, "install_" + stage):
+            return [stage]
+    return []
+
+
 def main(args=None):
     description = colored("Madcore CLI {0} - (c) 2016-2018 Madcore Ltd <https://madcore.ai>".format(get_version()), 'white', attrs=['bold'])
     parser = MyParser(prog="./madcore.py", description=description)
@@ -70,6 +89,7 @@ def main(args=None):
     group.add_argument('--kubectl-use-context', help='kubectl use context', action='store_true')
     group.add_argument('--mini-hostname', help='set minikube hostname (will sudo)', action='store_true')
     group.add_argument('--get-attr', dest="attr", help='get atribute', action='store')
+    group.add_argument('--install', dest="install", metavar=('STAGE[,STAGE...]'), help='install element stages of the clusterfile in order, rendering the next while the current one applies', action='store')
     group.add_argument('--install-core', help='install core of Madcore', action='store_true')
     group.add_argument('--install-elk', help='install elk', action='store_true')
     group.add_argument('--install-neo4j', help='install neo4j', action='store_true')
@@ -77,21 +97,59 @@ def main(args=None):
     group.add_argument('--install-flink', help='install apache flink', action='store_true')
     group.add_argument('--install-scrapy', help='install scrapy cluster', action='store_true')
     group.add_argument('--install-tron', help='install tron network', action='store_true')
+    group.add_argument('--preflight', help='check binaries, clusterfile and templates without changing anything', action='store_true')
+    group.add_argument('--render', dest="render", metavar=('STAGE'), nargs='?', const='', help='render templates of <stage> (default: all stages) in parallel without applying', action='store')
+    group.add_argument('--plan', dest="plan", metavar=('STAGE[,STAGE...]'), help='diff the rendered elements of <stage>s against the live cluster without applying', action='store')
+    group.add_argument('--probe', dest="probe", metavar=('URL'), nargs='*', help='wait until element endpoints (default: all ingress hosts) answer over http', action='store')
+    parser.add_argument('--fleet', dest="fleet", metavar=('CLUSTERFILE'), nargs='+', help='run status (default), --kops-validate or --install stages on all <clusterfile>s concurrently', action='store')
+    parser.add_argument('--force', dest="force", help='apply every element, even those unchanged since the last successful apply', action='store_true')
+    parser.add_argument('--diskless', dest="diskless", help='pipe rendered manifests to kubectl apply over stdin instead of writing ~/.madcore/rendered', action='store_true')
+    parser.add_argument('--batch', dest="batch", help='apply the elements of a stage as one multi-document apply per taint segment', action='store_true')
+    parser.add_argument('--server-side', dest="server_side", help='use server-side apply (kubernetes 1.16+)', action='store_true')
+    parser.add_argument('--no-wait', dest="no_wait", help='apply elements without waiting for their deployments, statefulsets and daemonsets to become ready', action='store_true')
+    parser.add_argument('--keep-rendered', dest="keep_rendered", help='with --diskless, still write the rendered manifests to ~/.madcore/rendered', action='store_true')
+    parser.add_argument('--probe-deadline', dest="probe_deadline", metavar=('SECONDS'), type=int, default=300, help='per endpoint deadline for --probe (default 300)', action='store')
+    parser.add_argument('--trace', dest="trace", metavar=('FILE'), help='write a chrome trace (perfetto json) of every command to <file>', action='store')
+    parser.add_argument('--kube-api', dest="kube_api", help='talk to the kubernetes api in-process over pooled connections instead of spawning kubectl', action='store_true')
+    replay = parser.add_mutually_exclusive_group()
+    replay.add_argument('--record', dest="record", metavar=('FILE'), help='record every external command and its output to fixture <file>', action='store')
+    replay.add_argument('--replay', dest="replay", metavar=('FILE'), help='serve external commands from fixture <file> instead of running them', action='store')
+    parser.add_argument('--log-level', dest="log_level", choices=sorted(log.LEVELS, key=log.LEVELS.get), help='lowest level of messages shown (default info), command output is always shown', action='store')
+    parser.add_argument('--log-json', dest="log_json", help='write json lines instead of colored text, for ci and log shippers', action='store_true')
+    parser.add_argument('-j', '--jobs', dest="jobs", metavar=('N'), type=int, help='max number of commands run concurrently (default {0})'.format(Executor.default_workers), action='store')
 
     args = parser.parse_args()
+    Log.configure(level=args.log_level, json_lines=args.log_json)
 
     if not args.attr:
-        print
-        print description
-        print
+        Static.echo()
+        Static.echo(description)
+        Static.echo()
 
     args = parser.parse_args()
+    if args.jobs:
+        Executor.default_workers = args.jobs
+    if args.trace:
+        Tracer.enable(args.trace)
+    if args.record:
+        Replay.start_recording(args.record)
+    elif args.replay:
+        Replay.start_replay(args.replay)
+    if args.fleet:
+        fl = fleet.Fleet(args, args.fleet)
+        if args.kops_validate:
+            fl.run(fleet.Fleet.VALIDATE)
+        elif install_stages(args):
+            fl.run(fleet.Fleet.INSTALL, install_stages(args))
+        else:
+            fl.run(fleet.Fleet.STATUS)
+        return
+
     sett = settings.Settings(args)
 
     if args.provision:
         sett.set_clusterfile()
         sett.save_settings_file()
-        sett.load_clusterfile()
         prov = provision.Provision(sett)
         prov.start()
         return
@@ -100,7 +158,6 @@ def main(args=None):
         # switch happens in settings
         sett.set_clusterfile()
         sett.save_settings_file()
-        sett.load_clusterfile()
         kc = cmdkubectl.CmdKubectl(sett)
         kc.use_context()
         return
@@ -111,12 +168,19 @@ def main(args=None):
         kc.get_context()
         return
 
+    elif args.attr:
+        # read only and quiet, scripts call this concurrently and parse the
+        # output. the clusterfile is parsed here, settings are never written
+        if args.attr == "domain":
+            Log.flush()
+            sys.stdout.write(sett.provision.domain)
+        return
+
     # settings for the
 
+    # the clusterfile itself is loaded on first use
     sett.set_clusterfile()
     sett.save_settings_file()
-    sett.load_clusterfile()
-    sett.set_zone()
 
     if args.destroy:
         prov = provision.Provision(sett)
@@ -130,41 +194,20 @@ def main(args=None):
         kops = cmdkops.CmdKops(sett)
         kops.validate_cluster()
 
-    elif args.install_core:
-        el = elements.Elements(sett)
-        el.kubectl_install_elements("core")
-
-    elif args.install_elk:
-        el = elements.Elements(sett)
-        el.kubectl_install_elements("elk")
-
-    elif args.install_neo4j:
-        el = elements.Elements(sett)
-        el.kubectl_install_elements("neo4j")
-
-    elif args.install_kafka:
-        el = elements.Elements(sett)
-        el.kubectl_install_elements("kafka")
-
-    elif args.install_flink:
-        el = elements.Elements(sett)
-        el.kubectl_install_elements("flink")
+    elif args.preflight:
+        preflight.Preflight(sett).run()
 
-    elif args.install_scrapy:
+    elif args.render is not None:
+        Static.figletcyber("RENDER")
         el = elements.Elements(sett)
-        el.kubectl_install_elements("scrapy")
+        el.render_stages([args.render] if args.render else None)
 
-    elif args.install_scrapyrc:
-        el = elements.Elements(sett)
-        el.kubectl_install_elements("scrapyrc")
-
-    elif args.install_storm:
-        el = elements.Elements(sett)
-        el.kubectl_install_elements("storm")
+    elif args.plan:
+        plan.Plan(sett).run([stage.strip() for stage in args.plan.split(",") if stage.strip()])
 
-    elif args.install_tron:
+    elif install_stages(args):
         el = elements.Elements(sett)
-        el.kubectl_install_elements("tron")
+        el.install_stages(install_stages(args))
 
     elif args.kubectl_use_context:
         kc = cmdkubectl.CmdKubectl(sett)
@@ -174,21 +217,21 @@ def main(args=None):
         prov = provision.Provision(sett)
         prov.mini_hostname()
 
+    elif args.probe is not None:
+        Static.figletcyber("PROBE")
+        kc = cmdkubectl.CmdKubectl(sett)
+        urls = args.probe or kc.get_endpoint_urls()
+        Static.msg("Probing endpoints", len(urls))
+        results = prober.Prober(deadline=args.probe_deadline).wait_all(urls)
+        prober.Prober.report(results)
+        if not all(r.up for r in results):
+            raise SystemExit(32)
 
 
-
-    elif args.attr:
-
-        if args.attr == "domain":
-            sys.stdout.write(settings.provision.domain)
-
     else:
         Static.figletcyber("STATUS")
         kc = cmdkubectl.CmdKubectl(sett)
-        kc.get_nodes()
-        kc.get_pods()
-        kc.get_svc()
-        kc.get_ing()
+        kc.get_status()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,236 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from static import Static
+from cmd import Cmd
+from executor import Executor
+from kubeapi import KubeApiError
+from prettytable import PrettyTable
+import collections
+import elements
+import os
+import re
+import yaml
+
+
+class Change(object):
+    CREATE = "create"
+    CHANGE = "change"
+    IN_SYNC = "in sync"
+    ERROR = "ERROR"
+
+    def __init__(self, element, resource, state, added=0, removed=0, detail=""):
+        self.element = element
+        self.resource = resource
+        self.state = state
+        self.added = added
+        self.removed = removed
+        self.detail = detail
+
+
+class Plan(object):
+    # what installing the stages would do, from a server-side diff of every
+    # element against the live cluster. nothing is applied.
+
+    # kubectl diff names its files [group.]version.Kind.namespace.name
+    diff_name = re.compile(r"^(?:(.+)\.)?(v\d+(?:alpha\d+|beta\d+)?)\.([A-Za-z0-9]+)\.([^.]*)\.(.+)$")
+    hunk_header = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+    # server managed, never part of what we apply
+    ignored_fields = ("metadata.resourceVersion", "metadata.generation", "metadata.managedFields",
+                      "metadata.creationTimestamp", "metadata.uid", "metadata.selfLink", "status")
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.elements = elements.Elements(self.settings)
+        self.kubectl = self.elements.CmdKubectl
+
+    def run(self, stages):
+        for stage in stages:
+            if stage not in self.settings.elements:
+                Static.msg_bold("Stage not found in clusterfile", stage)
+                raise SystemExit(32)
+
+        Static.figletcyber("PLAN {0}".format(" ".join(stages).upper()))
+        self.elements.cluster_ips()
+        ex = Executor()
+        for stage in stages:
+            for element in self.settings.elements[stage] or []:
+                ex.submit(element.get("name"), self.plan_element, element)
+        changes = [change for result in ex.gather() for change in result]
+        self.report(changes)
+
+        states = collections.OrderedDict()
+        for change in changes:
+            states.setdefault(change.element, set()).add(change.state)
+        counts = collections.Counter(self.element_state(s) for s in states.values())
+        Static.msg("Plan for {0} elements".format(len(states)), "{0} to create, {1} to change, {2} in sync".format(
+            counts[Change.CREATE], counts[Change.CHANGE], counts[Change.IN_SYNC]))
+        if counts[Change.ERROR]:
+            Static.msg_bold("PLAN FAILED", "{0} elements could not be diffed".format(counts[Change.ERROR]))
+            raise SystemExit(32)
+        return changes
+
+    @staticmethod
+    def element_state(states):
+        # an element is created only when all of its resources are new
+        if Change.ERROR in states:
+            return Change.ERROR
+        if states == {Change.CREATE}:
+            return Change.CREATE
+        if states - {Change.IN_SYNC}:
+            return Change.CHANGE
+        return Change.IN_SYNC
+
+    def plan_element(self, element):
+        name = element.get("name")
+        try:
+            item = elements.Struct(**element)
+            data = self.elements.localtemplate.write_element(item, save=False, keep=True).data
+            docs = [doc for doc in yaml.safe_load_all(data) if doc]
+        except Exception as e:
+            return [Change(name, "-", Change.ERROR, detail="{0}: {1}".format(type(e).__name__, e))]
+
+        if self.kubectl.api():
+            return [self.diff_api(name, doc) for doc in docs]
+        return self.diff_kubectl(name, data, docs)
+
+    def diff_kubectl(self, name, data, docs):
+        # exit 1 means differences, unless nothing came out (kubectl before
+        # 1.18 also exits 1 on errors)
+        result = Cmd.execute(name, self.kubectl.kubectl(["diff", "-f", "-"]), stdin=data)
+        if result.returncode > 1 or (result.returncode == 1 and not result.out.strip()):
+            return [Change(name, "-", Change.ERROR, detail=(result.err.strip() or result.out.strip()).split("\n")[0])]
+
+        diffs = self.parse_diff(result.out)
+        changes = []
+        for doc in docs:
+            metadata = doc.get("metadata") or {}
+            key = (doc.get("kind"), metadata.get("name"))
+            found = [d for d in diffs.get(key, []) if not metadata.get("namespace") or d[0] in ("", metadata["namespace"])]
+            resource = "{0}/{1}".format(doc.get("kind"), metadata.get("name"))
+            if not found:
+                changes.append(Change(name, resource, Change.IN_SYNC))
+                continue
+            namespace, created, added, removed = found[0]
+            changes.append(Change(name, resource, Change.CREATE if created else Change.CHANGE, added, removed))
+        return changes
+
+    def parse_diff(self, text):
+        # unified diff of live vs merged objects -> (kind, name) ->
+        # [(namespace, created, added lines, removed lines)]
+        diffs = {}
+        current = None
+        old_left = new_left = 0
+        lines = text.splitlines()
+        for i, line in enumerate(lines):
+            if old_left > 0 or new_left > 0:
+                if line.startswith("+"):
+                    current[2] += 1
+                    new_left -= 1
+                elif line.startswith("-"):
+                    current[3] += 1
+                    old_left -= 1
+                elif not line.startswith("\\"):
+                    old_left -= 1
+                    new_left -= 1
+                continue
+
+            if line.startswith("+++ ") and i > 0 and lines[i - 1].startswith("--- "):
+                path = line[4:].split("\t")[0].split(" ")[0]
+                match = self.diff_name.match(os.path.basename(path))
+                if not match:
+                    current = None
+                    continue
+                group, version, kind, namespace, resource = match.groups()
+                current = [namespace, True, 0, 0]
+                diffs.setdefault((kind, resource), []).append(current)
+                continue
+
+            match = self.hunk_header.match(line)
+            if match and current is not None:
+                old_left = int(match.group(2) if match.group(2) is not None else 1)
+                new_left = int(match.group(4) if match.group(4) is not None else 1)
+                # a new object is diffed against an empty file
+                current[1] = current[1] and match.group(1) == "0" and old_left == 0
+
+        return dict((key, [tuple(d) for d in value]) for key, value in diffs.items())
+
+    def diff_api(self, name, doc):
+        # dry run patch, then compare what the server would store with what
+        # it has now
+        api = self.kubectl.api()
+        metadata = doc.get("metadata") or {}
+        resource = "{0}/{1}".format(doc.get("kind"), metadata.get("name"))
+        try:
+            collection = api.resource_path(doc["apiVersion"], doc["kind"], metadata.get("namespace"))
+            path = "{0}/{1}".format(collection, metadata["name"])
+            try:
+                live = api.get(path)
+            except KubeApiError as e:
+                if e.status != 404:
+                    raise
+                return Change(name, resource, Change.CREATE, len(self.flatten(doc)), 0)
+            try:
+                merged = api.patch(path, doc, "strategic", dryRun="All")
+            except KubeApiError as e:
+                # custom resources don't support strategic merge
+                if e.status != 415:
+                    raise
+                merged = api.patch(path, doc, "merge", dryRun="All")
+        except KubeApiError as e:
+            return Change(name, resource, Change.ERROR, detail=str(e))
+
+        before, after = self.flatten(live), self.flatten(merged)
+        added = len([k for k in after if k not in before or before[k] != after[k]])
+        removed = len([k for k in before if k not in after or before[k] != after[k]])
+        if not added and not removed:
+            return Change(name, resource, Change.IN_SYNC)
+        return Change(name, resource, Change.CHANGE, added, removed)
+
+    def flatten(self, obj, prefix=""):
+        # dotted path -> leaf value, without the fields the server manages
+        out = {}
+        if prefix in self.ignored_fields:
+            return out
+        if isinstance(obj, dict) and obj:
+            for key, value in obj.items():
+                out.update(self.flatten(value, "{0}.{1}".format(prefix, key) if prefix else key))
+        elif isinstance(obj, list) and obj:
+            for i, value in enumerate(obj):
+                out.update(self.flatten(value, "{0}.{1}".format(prefix, i)))
+        else:
+            out[prefix] = obj
+        return out
+
+    def report(self, changes):
+        table = PrettyTable(["ELEMENT", "RESOURCE", "STATE", "+", "-", "DETAIL"])
+        table.border = False
+        table.align = "l"
+        previous = None
+        for c in changes:
+            table.add_row([c.element if c.element != previous else "", c.resource, c.state,
+                           c.added or "", c.removed or "", c.detail[:80]])
+            previous = c.element
+        Static.echo(table.get_string())
+        Static.echo()
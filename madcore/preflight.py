@@ -0,0 +1,220 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from static import Static
+from cmd import Cmd
+from executor import Executor
+from prettytable import PrettyTable
+import cmdkops
+import localtemplate
+import os
+import re
+
+
+class Check(object):
+    OK = "ok"
+    WARN = "warn"
+    FAIL = "FAIL"
+
+    def __init__(self, group, name, state, detail=""):
+        self.group = group
+        self.name = name
+        self.state = state
+        self.detail = detail
+
+
+class Preflight(object):
+    # cheap checks run concurrently before anything slow (kops, minikube
+    # start, kubectl apply), reported together in one table
+
+    binaries = {
+        # no --short, kubectl 1.28 removed it
+        "aws": [["kops", "version"], ["kubectl", "version", "--client"]],
+        "minikube": [["minikube", "version"], ["kubectl", "version", "--client"]],
+    }
+
+    # clusterfile keys every cloud needs, then per cloud
+    required = {
+        "cluster": ["name", "ingress_instance_group"],
+        "provision": ["cloud", "domain", "kubernetesVersion"],
+    }
+    required_cloud = {
+        "aws": {
+            "provision": ["region", "zone_id", "vpc_id", "vpc_CIDR", "dnszone_id", "s3_store",
+                          "kops_verbosity", "subnets", "master", "instance_groups"],
+        },
+        "minikube": {},
+    }
+    required_master = ["machineType", "minSize", "maxSize", "rootVolumeSize", "rootVolumeType"]
+    required_ig = ["name", "machineType", "minSize", "maxSize"]
+
+    def __init__(self, settings, elements=True):
+        # elements=False when provisioning, which applies no elements:
+        # broken element templates are reported as warnings only
+        self.settings = settings
+        self.elements = elements
+        self.localtemplate = localtemplate.LocalTemplate(self.settings)
+        self.cloud = self.settings.provision.cloud
+
+    def run(self):
+        Static.figletcyber("PREFLIGHT")
+        ex = Executor()
+        for argv in Preflight.binaries.get(self.cloud, []):
+            ex.submit(argv[0], self.check_binary, argv)
+        ex.submit("clusterfile", self.check_clusterfile)
+        for name, render, severity in self.templates():
+            ex.submit(name, self.check_template, name, render, severity)
+
+        checks = []
+        for result in ex.gather():
+            checks.extend(result if isinstance(result, list) else [result])
+        self.report(checks)
+
+        failed = [c for c in checks if c.state == Check.FAIL]
+        if failed:
+            Static.msg_bold("PREFLIGHT FAILED", "{0} of {1} checks".format(len(failed), len(checks)))
+            raise SystemExit(32)
+        Static.msg("Preflight passed", "{0} checks".format(len(checks)))
+
+    def check_binary(self, argv):
+        returncode, out, err = Cmd.exec_capture(argv, "{0} version".format(argv[0]))
+        lines = [l.strip() for l in (out + err).splitlines() if l.strip()]
+        detail = lines[0] if lines else ""
+        # kubectl before 1.28 prints a version.Info struct without --short
+        git_version = re.search(r'GitVersion:"([^"]+)"', detail)
+        if git_version:
+            detail = "Client Version: {0}".format(git_version.group(1))
+        if returncode == 127:
+            return Check("binary", argv[0], Check.FAIL, "not found in PATH")
+        if returncode != 0:
+            return Check("binary", argv[0], Check.FAIL, detail or "exit {0}".format(returncode))
+
+        # the bundled kops specs are written for one kops release
+        if argv[0] == "kops":
+            wanted = self.kops_template_version()
+            found = re.search(r"(\d+\.\d+)", detail)
+            if wanted and found and not wanted.startswith(found.group(1) + "."):
+                return Check("binary", "kops", Check.WARN, "{0}, templates are for {1}".format(detail, wanted))
+        return Check("binary", argv[0], Check.OK, detail)
+
+    def kops_template_version(self):
+        found = re.match(r"kops\.(\d+\.\d+\.\d+)\.", cmdkops.CmdKops.file_local_cluster)
+        return found.group(1) if found else None
+
+    def check_clusterfile(self):
+        checks = []
+
+        def missing(data, keys, where):
+            absent = [k for k in keys if not isinstance(data, dict) or data.get(k) in (None, "")]
+            if absent:
+                checks.append(Check("clusterfile", where, Check.FAIL, "missing " + ", ".join(absent)))
+            return absent
+
+        if self.cloud not in Preflight.required_cloud:
+            checks.append(Check("clusterfile", "provision.cloud", Check.FAIL, "unknown cloud {0}".format(self.cloud)))
+            return checks
+
+        sections = {"cluster": self.settings.cluster.__dict__, "provision": self.settings.provision.__dict__}
+        for section, data in sections.items():
+            keys = Preflight.required[section] + Preflight.required_cloud[self.cloud].get(section, [])
+            missing(data, keys, section)
+
+        if self.cloud == "aws":
+            provision = self.settings.provision
+            if getattr(provision, "s3_store", None) and not str(provision.s3_store).startswith("s3://"):
+                checks.append(Check("clusterfile", "provision.s3_store", Check.FAIL, "must start with s3://"))
+            if getattr(provision, "master", None) is not None:
+                missing(provision.master, Preflight.required_master, "provision.master")
+
+            names = []
+            for i, ig in enumerate(getattr(provision, "instance_groups", None) or []):
+                where = "provision.instance_groups[{0}]".format(i)
+                if missing(ig, Preflight.required_ig, where):
+                    continue
+                names.append(ig["name"])
+                try:
+                    if int(ig["minSize"]) > int(ig["maxSize"]):
+                        checks.append(Check("clusterfile", where, Check.FAIL, "minSize is larger than maxSize"))
+                except (TypeError, ValueError):
+                    checks.append(Check("clusterfile", where, Check.FAIL, "minSize and maxSize must be numbers"))
+            if len(set(names)) != len(names):
+                checks.append(Check("clusterfile", "provision.instance_groups", Check.FAIL, "duplicate names"))
+            ingress = getattr(self.settings.cluster, "ingress_instance_group", None)
+            if ingress and names and ingress not in names:
+                checks.append(Check("clusterfile", "cluster.ingress_instance_group", Check.FAIL,
+                                    "{0} is not an instance group".format(ingress)))
+
+        for stage, elements in (self.settings.elements or {}).items():
+            for i, element in enumerate(elements or []):
+                missing(element, ["name", "template"], "elements.{0}[{1}]".format(stage, i))
+
+        if not checks:
+            checks.append(Check("clusterfile", os.path.basename(self.settings.settings.clusterfile), Check.OK,
+                                "{0} stages".format(len(self.settings.elements or {}))))
+        return checks
+
+    def templates(self):
+        # (template, render function, state on failure) for everything this
+        # clusterfile uses
+        lt = self.localtemplate
+        out = []
+        if self.cloud == "aws":
+            out.append((cmdkops.CmdKops.file_local_cluster, lambda: lt.render(cmdkops.CmdKops.file_local_cluster), Check.FAIL))
+            out.append((cmdkops.CmdKops.file_local_master, lambda: lt.render(cmdkops.CmdKops.file_local_master), Check.FAIL))
+            for ig in getattr(self.settings.provision, "instance_groups", None) or []:
+                if isinstance(ig, dict) and ig.get("name"):
+                    out.append(("{0} ({1})".format(cmdkops.CmdKops.file_local_nodes, ig["name"]),
+                                lambda ig=ig: lt.render(cmdkops.CmdKops.file_local_nodes, ig=ig), Check.FAIL))
+
+        seen = set()
+        for stage, elements in (self.settings.elements or {}).items():
+            for element in elements or []:
+                if not isinstance(element, dict) or not element.get("template") or element["template"] in seen:
+                    continue
+                seen.add(element["template"])
+                item = localtemplate.Struct(**element)
+                out.append((element["template"], lambda item=item: lt.write_element(item, save=False),
+                            Check.FAIL if self.elements else Check.WARN))
+        return out
+
+    def check_template(self, name, render, severity=Check.FAIL):
+        template = name.split(" ")[0]
+        folders = [self.settings.folder_user_templates, self.settings.folder_app_templates]
+        if not any(os.path.isfile(os.path.join(folder, template)) for folder in folders):
+            return Check("template", name, severity, "file not found")
+        try:
+            render()
+        except Exception as e:
+            return Check("template", name, severity, "{0}: {1}".format(type(e).__name__, e))
+        return Check("template", name, Check.OK, "renders")
+
+    def report(self, checks):
+        order = {Check.FAIL: 0, Check.WARN: 1, Check.OK: 2}
+        table = PrettyTable(["CHECK", "NAME", "STATE", "DETAIL"])
+        table.border = False
+        table.align = "l"
+        for c in sorted(checks, key=lambda c: (order[c.state], c.group, c.name)):
+            table.add_row([c.group, c.name, c.state, c.detail[:100]])
+        Static.echo(table.get_string())
+        Static.echo()
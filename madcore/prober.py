@@ -0,0 +1,120 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from static import Static
+from retry import Retry
+from executor import Executor
+from prettytable import PrettyTable
+import time
+import urllib3
+
+
+class ProbeResult(object):
+    url = None
+    up = False
+    status = None
+    attempts = 0
+    # seconds taken by the last request
+    latency = None
+    # seconds until the endpoint came up, or until we gave up
+    elapsed = None
+    error = None
+
+    def __init__(self, url):
+        self.url = url
+
+
+class Prober(object):
+    # waits for many http endpoints at once over pooled keep-alive
+    # connections, each url with its own deadline and backoff
+
+    def __init__(self, deadline=300, timeout=10.0, verify=False, max_workers=None):
+        self.deadline = deadline
+        self.max_workers = max_workers
+        if not verify:
+            urllib3.disable_warnings()
+        self.http = urllib3.PoolManager(
+            num_pools=64,
+            maxsize=2,
+            retries=False,
+            timeout=urllib3.Timeout(connect=timeout, read=timeout),
+            cert_reqs="CERT_REQUIRED" if verify else "CERT_NONE",
+        )
+
+    def probe(self, result):
+        # anything below 400 counts as up, same as raise_for_status
+        start = time.time()
+        try:
+            response = self.http.request("GET", result.url, preload_content=False, redirect=False)
+            response.release_conn()
+            result.status = response.status
+            result.error = None
+        except urllib3.exceptions.HTTPError as e:
+            result.status = None
+            result.error = self.reason(e)
+        result.latency = time.time() - start
+
+        if result.status is not None and result.status < 400:
+            return Retry.DONE, None
+        return Retry.RETRY, result.error or "HTTP {0}".format(result.status)
+
+    def reason(self, error):
+        # urllib3 prefixes connection errors with the connection object repr
+        error = getattr(error, "reason", None) or error
+        message = str(error)
+        if message.startswith("<") and ">: " in message:
+            message = message.split(">: ", 1)[1]
+        return message
+
+    def wait(self, url):
+        result = ProbeResult(url)
+        retry = Retry(url, deadline=self.deadline, initial=1.0, maximum=10.0, verbose=False)
+        state, detail = retry.poll(lambda: self.probe(result))
+        result.up = state == Retry.DONE
+        result.attempts = retry.attempts
+        result.elapsed = retry.elapsed
+        return result
+
+    def wait_all(self, urls):
+        ex = Executor(self.max_workers or len(urls) or 1)
+        for url in urls:
+            ex.submit(url, self.wait, url)
+        return ex.gather()
+
+    @staticmethod
+    def report(results):
+        table = PrettyTable(["URL", "STATE", "HTTP", "ATTEMPTS", "LATENCY ms", "READY AFTER s"])
+        table.border = False
+        table.align = "l"
+        for r in results:
+            table.add_row([
+                r.url,
+                "up" if r.up else "DOWN",
+                r.status or (r.error or "-")[:60],
+                r.attempts,
+                int(r.latency * 1000) if r.latency is not None else "-",
+                "{0:.1f}".format(r.elapsed) if r.elapsed is not None else "-",
+            ])
+        Static.echo(table.get_string())
+        Static.echo()
@@ -24,11 +24,13 @@ SOFTWARE.
 
 from static import Static
 from cmd import Cmd
+from applycache import ApplyCache
 import subprocess
 import os
 import sys
 import cmdkops
 import cmdminikube
+import preflight
 
 
 class Provision(object):
@@ -42,7 +44,11 @@ class Provision(object):
         self.minikube = cmdminikube.Minikube(self.settings)
 
     def start(self):
+        preflight.Preflight(self.settings, elements=False).run()
+
         Static.figletcyber("PROVISIONING")
+        # a new cluster has nothing applied yet
+        ApplyCache(self.settings).clear()
         if self.settings.provision.cloud == "aws":
             self.kops.create_cluster()
             self.kops.update_settings()
@@ -74,6 +80,7 @@ class Provision(object):
         else:
             Static.msg_bold("No such provisioner specified in config", self.settings.provision.cloud)
             raise SystemExit(32)
+        ApplyCache(self.settings).clear()
 
     def check_alive(self):
         Static.figletcyber("STATUS")
@@ -0,0 +1,219 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from static import Static
+from cmd import Cmd
+from retry import Retry
+from executor import Executor
+from kubeapi import KubeApiError
+from prettytable import PrettyTable
+import json
+import time
+import yaml
+
+
+class Workload(object):
+    kind = None
+    namespace = None
+    name = None
+    api_version = None
+
+    def __init__(self, doc):
+        metadata = doc.get("metadata") or {}
+        self.kind = doc["kind"]
+        self.api_version = doc.get("apiVersion")
+        self.namespace = metadata.get("namespace") or "default"
+        self.name = metadata.get("name")
+
+    def ref(self):
+        return "{0}/{1}".format(self.kind.lower(), self.name)
+
+
+class ReadyResult(object):
+    element = None
+    workloads = 0
+    # ready, unchanged, no wait, TIMEOUT or FAIL
+    state = None
+    # seconds from the end of the apply until every workload was ready
+    elapsed = None
+    detail = None
+
+    def __init__(self, element, workloads=0, state=None, elapsed=None, detail=None):
+        self.element = element
+        self.workloads = workloads
+        self.state = state
+        self.elapsed = elapsed
+        self.detail = detail
+
+
+class Readiness(object):
+    # waits until the workloads an element just applied have rolled out.
+    # kubectl rollout status and the api watch both return on the status
+    # update that completes the rollout, instead of sleeping a fixed time.
+
+    kinds = ("Deployment", "StatefulSet", "DaemonSet")
+    default_timeout = 300
+
+    def __init__(self, kubectl):
+        self.kubectl = kubectl
+
+    @staticmethod
+    def workloads(data):
+        return [Workload(doc) for doc in yaml.safe_load_all(data)
+                if isinstance(doc, dict) and doc.get("kind") in Readiness.kinds]
+
+    @staticmethod
+    def status(obj):
+        # (ready, detail) for a workload object, same rules as kubectl
+        # rollout status
+        kind = obj["kind"]
+        spec = obj.get("spec") or {}
+        status = obj.get("status") or {}
+        generation = obj["metadata"].get("generation") or 0
+        if status.get("observedGeneration", 0) < generation:
+            return False, "waiting for spec update to be observed"
+
+        if kind == "DaemonSet":
+            desired = status.get("desiredNumberScheduled", 0)
+            if status.get("updatedNumberScheduled", 0) < desired:
+                return False, "{0} of {1} updated pods scheduled".format(status.get("updatedNumberScheduled", 0), desired)
+            if status.get("numberAvailable", 0) < desired:
+                return False, "{0} of {1} updated pods available".format(status.get("numberAvailable", 0), desired)
+            return True, None
+
+        replicas = spec.get("replicas", 1)
+        if kind == "StatefulSet":
+            if status.get("readyReplicas", 0) < replicas:
+                return False, "{0} of {1} pods ready".format(status.get("readyReplicas", 0), replicas)
+            strategy = (spec.get("updateStrategy") or {}).get("type")
+            if strategy != "OnDelete" and status.get("updateRevision") and \
+                    status.get("updateRevision") != status.get("currentRevision"):
+                return False, "waiting for rolling update to finish"
+            return True, None
+
+        for condition in status.get("conditions") or []:
+            if condition.get("type") == "Progressing" and condition.get("reason") == "ProgressDeadlineExceeded":
+                raise KubeApiError("rollout", "{0} exceeded its progress deadline".format(obj["metadata"]["name"]))
+        updated = status.get("updatedReplicas", 0)
+        if updated < replicas:
+            return False, "{0} of {1} updated replicas".format(updated, replicas)
+        if status.get("replicas", 0) > updated:
+            return False, "{0} old replicas pending termination".format(status.get("replicas", 0) - updated)
+        if status.get("availableReplicas", 0) < updated:
+            return False, "{0} of {1} updated replicas available".format(status.get("availableReplicas", 0), updated)
+        return True, None
+
+    def wait(self, name, data, timeout=None):
+        # blocks until every workload in the rendered manifest data is
+        # ready, all of them watched at once
+        timeout = self.default_timeout if timeout is None else timeout
+        workloads = self.workloads(data)
+        result = ReadyResult(name, len(workloads))
+        if not timeout:
+            result.state = "no wait"
+            return result
+
+        start = time.time()
+        if workloads:
+            Static.msg("Waiting for {0} workloads of".format(len(workloads)), name)
+            ex = Executor(len(workloads))
+            for workload in workloads:
+                ex.submit(workload.ref(), self.wait_workload, workload, start + timeout)
+            failures = [detail for detail in ex.gather() if detail]
+            if failures:
+                result.state = "TIMEOUT" if all(d.startswith("timed out") for d in failures) else "FAIL"
+                result.detail = "; ".join(failures)
+        result.state = result.state or "ready"
+        result.elapsed = time.time() - start
+        return result
+
+    def wait_workload(self, workload, deadline):
+        # None when ready, otherwise what went wrong
+        if self.kubectl.api():
+            return self.watch_workload(workload, deadline)
+
+        remaining = max(1.0, deadline - time.time())
+        cmd = self.kubectl.kubectl(["rollout", "status", workload.ref(), "-n", workload.namespace])
+        result = Cmd.execute(workload.ref(), cmd, timeout=remaining)
+        if result.timed_out:
+            return "timed out: {0} after {1:.0f}s".format(workload.ref(), remaining)
+        if result.returncode == 0:
+            return None
+        if "only available for RollingUpdate" in result.err:
+            # OnDelete statefulsets have no rollout to watch
+            return self.poll_workload(workload, deadline)
+        return "{0}: {1}".format(workload.ref(), result.err.strip() or result.out.strip())
+
+    def poll_workload(self, workload, deadline):
+        cmd = self.kubectl.kubectl(["get", workload.ref(), "-n", workload.namespace, "-o", "json"])
+
+        def probe():
+            returncode, out, err = Cmd.exec_capture(cmd, workload.ref())
+            if returncode != 0:
+                return Retry.classify(returncode, err), err.strip()
+            ready, detail = self.status(json.loads(out))
+            return (Retry.DONE, None) if ready else (Retry.RETRY, detail)
+
+        retry = Retry(workload.ref(), deadline=max(0, deadline - time.time()), initial=1.0, maximum=10.0, verbose=False)
+        state, detail = retry.poll(probe)
+        if state == Retry.DONE:
+            return None
+        if state == Retry.RETRY:
+            return "timed out: {0} ({1})".format(workload.ref(), detail)
+        return "{0}: {1}".format(workload.ref(), detail)
+
+    def watch_workload(self, workload, deadline):
+        api = self.kubectl.api()
+        try:
+            collection = api.resource_path(workload.api_version, workload.kind, workload.namespace)
+            detail = None
+            # the server ends a watch after timeoutSeconds, or earlier on its
+            # own, so rewatch until the deadline
+            while time.time() < deadline:
+                remaining = max(1, int(deadline - time.time()))
+                for kind, obj in api.watch(collection, remaining, fieldSelector="metadata.name=" + workload.name):
+                    if kind in ("ADDED", "MODIFIED"):
+                        obj.setdefault("kind", workload.kind)
+                        ready, detail = self.status(obj)
+                        if ready:
+                            return None
+        except KubeApiError as e:
+            return "{0}: {1}".format(workload.ref(), e)
+        return "timed out: {0} ({1})".format(workload.ref(), detail or "not found")
+
+    @staticmethod
+    def report(results):
+        table = PrettyTable(["ELEMENT", "WORKLOADS", "STATE", "READY AFTER s", "DETAIL"])
+        table.border = False
+        table.align = "l"
+        for r in results:
+            table.add_row([
+                r.element,
+                r.workloads,
+                r.state,
+                "{0:.1f}".format(r.elapsed) if r.elapsed is not None else "-",
+                (r.detail or "")[:80],
+            ])
+        Static.echo(table.get_string())
+        Static.echo()
@@ -0,0 +1,114 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from static import Static
+import atexit
+import json
+import os
+import threading
+
+
+class Replay(object):
+    # record every external command to a fixture file, or serve a fixture
+    # back without running kubectl/kops/minikube at all
+
+    RECORD = "record"
+    REPLAY = "replay"
+    version = 1
+
+    mode = None
+    path = None
+    calls = []
+    # replay: command key -> recorded calls not served yet
+    pending = {}
+    lock = threading.Lock()
+
+    @staticmethod
+    def key(cmd):
+        if isinstance(cmd, list):
+            return json.dumps(cmd)
+        return cmd
+
+    @staticmethod
+    def start_recording(path):
+        Replay.mode = Replay.RECORD
+        Replay.path = path
+        atexit.register(Replay.save)
+
+    @staticmethod
+    def start_replay(path):
+        if not os.path.isfile(path):
+            Static.msg_bold("Replay fixture not found", path)
+            raise SystemExit(32)
+
+        with open(path) as f:
+            fixture = json.load(f)
+
+        Replay.mode = Replay.REPLAY
+        Replay.path = path
+        for call in fixture["calls"]:
+            Replay.pending.setdefault(call["cmd"], []).append(call)
+
+    @staticmethod
+    def recording():
+        return Replay.mode == Replay.RECORD
+
+    @staticmethod
+    def replaying():
+        return Replay.mode == Replay.REPLAY
+
+    @staticmethod
+    def record(name, cmd, returncode, out, err, elapsed):
+        call = {
+            "name": name,
+            "cmd": Replay.key(cmd),
+            "returncode": returncode,
+            "stdout": out.decode("utf-8", "replace"),
+            "stderr": err.decode("utf-8", "replace"),
+            "elapsed": round(elapsed, 6),
+        }
+        with Replay.lock:
+            Replay.calls.append(call)
+
+    @staticmethod
+    def serve(name, cmd):
+        # calls with the same command are served in recorded order, the last
+        # one repeats so polling loops settle on the final state
+        with Replay.lock:
+            queue = Replay.pending.get(Replay.key(cmd))
+            if not queue:
+                Static.msg_bold("REPLAY", "no recording for {0}: {1}".format(name, Replay.key(cmd)))
+                raise SystemExit(32)
+            call = queue.pop(0) if len(queue) > 1 else queue[0]
+
+        return call["returncode"], call["stdout"].encode("utf-8"), call["stderr"].encode("utf-8")
+
+    @staticmethod
+    def save():
+        if not Replay.recording():
+            return
+
+        with open(Replay.path, "w") as f:
+            json.dump({"version": Replay.version, "calls": Replay.calls}, f, indent=1)
+        Static.msg("Recorded {0} commands to".format(len(Replay.calls)), Replay.path)
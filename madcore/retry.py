@@ -0,0 +1,133 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+from static import Static
+import random
+import re
+import time
+
+
+class Retry(object):
+    # probe results
+    DONE = "done"
+    RETRY = "retry"
+    FATAL = "fatal"
+
+    # cluster still coming up, api server not reachable yet, etc.
+    transient_patterns = [
+        r"timeout",
+        r"timed out",
+        r"connection refused",
+        r"connection reset",
+        r"no such host",
+        r"i/o timeout",
+        r"TLS handshake",
+        r"unexpected EOF",
+        r"ServiceUnavailable",
+        r"the server is currently unable",
+        r"your (nodes|masters) are NOT ready",
+        r"Validation Failed",
+    ]
+
+    # no amount of waiting fixes these
+    fatal_patterns = [
+        r"command not found",
+        r"unknown (flag|command|shorthand)",
+        r"cluster not found",
+        r"NoSuchBucket",
+        r"AccessDenied",
+        r"InvalidClientTokenId",
+        r"ExpiredToken",
+        r"State Store: Required value",
+        r"error: the server doesn't have a resource type",
+        r"No such file or directory",
+    ]
+
+    def __init__(self, name, deadline=1500, initial=1.0, maximum=30.0, factor=2.0, jitter=0.5, verbose=True):
+        self.name = name
+        self.deadline = deadline
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.verbose = verbose
+        self.attempts = 0
+        self.elapsed = 0.0
+
+    def delay(self, attempt):
+        # exponential backoff capped at maximum, jitter shaves off up to
+        # self.jitter of it so parallel waiters don't poll in lockstep
+        base = min(self.maximum, self.initial * (self.factor ** (attempt - 1)))
+        return base * random.uniform(1.0 - self.jitter, 1.0)
+
+    def poll(self, probe):
+        # probe() returns (state, detail). first probe goes out immediately.
+        # returns the last (state, detail): DONE, FATAL, or RETRY when the
+        # deadline ran out. self.attempts/self.elapsed tell how it went.
+        start = time.time()
+        self.attempts = 0
+        while True:
+            self.attempts += 1
+            state, detail = probe()
+            self.elapsed = time.time() - start
+
+            if state in (Retry.DONE, Retry.FATAL):
+                return state, detail
+
+            wait = self.delay(self.attempts)
+            if self.elapsed + wait > self.deadline:
+                return state, detail
+
+            if self.verbose:
+                Static.msg("RETRYING", "{0} in {1:.1f}s".format(self.name, wait))
+            time.sleep(wait)
+
+    def run(self, probe):
+        state, detail = self.poll(probe)
+
+        if state == Retry.DONE:
+            return detail
+
+        if state == Retry.FATAL:
+            Static.msg_bold("FAIL", "{0} (not retrying)".format(self.name.upper()))
+        else:
+            Static.msg_bold("FAIL", "{0} (gave up after {1} attempts, {2}s)".format(
+                self.name.upper(), self.attempts, int(self.elapsed)))
+        if detail:
+            Static.write(detail)
+        raise SystemExit(32)
+
+    @staticmethod
+    def classify(returncode, text):
+        # 126/127: shell could not run the binary at all
+        if returncode in (126, 127):
+            return Retry.FATAL
+        for pattern in Retry.transient_patterns:
+            if re.search(pattern, text, re.IGNORECASE):
+                return Retry.RETRY
+        for pattern in Retry.fatal_patterns:
+            if re.search(pattern, text, re.IGNORECASE):
+                return Retry.FATAL
+        # unknown errors keep the old behaviour and are retried
+        return Retry.RETRY
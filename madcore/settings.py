@@ -31,10 +31,12 @@ import subprocess
 import re
 from os.path import expanduser
 import errno
+import tempfile
 import cmdkubectl
 import os.path
 from static import Static
 from cmd import Cmd
+from yamlcache import YamlCache
 
 
 class Struct:
@@ -47,13 +49,15 @@ class Settings(object):
     # full arguments object passed
     args = None
 
-    aws_zone = None
     master_ip = None
     ingress_ips = []
+    # kubeconfig context every kubectl call is pinned to, None uses the
+    # current-context
+    kube_context = None
 
-    cluster = None
-    provision = None
-    elements = None
+    # cluster, provision, elements, filters and aws_zone come from the
+    # clusterfile, which is parsed on first use (see __getattr__)
+    clusterfile_attributes = ("cluster", "provision", "elements", "filters", "aws_zone")
 
     #current_context = None
     #data_path = None
@@ -61,12 +65,17 @@ class Settings(object):
     #config_locust = None
 
     settings = None
+    # settings as last read from or written to settings.yaml
+    settings_saved = None
     filepath_settings = None
     filepath_clusterfile = None
     folder_user = None
     folder_user_populated = None
     folder_user_clusters = None
+    folder_user_cache = None
+    folder_user_templates = None
     folder_app_templates = None
+    folder_app_templates_compiled = None
     folder_app_clusters = None
 
     def __init__(self, args):
@@ -76,7 +85,15 @@ class Settings(object):
         self.set_app_folders()
         self.load_settings_file()
 
+    def __getattr__(self, name):
+        # only called for attributes not set yet
+        if name in Settings.clusterfile_attributes:
+            self.load_clusterfile()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
     def set_zone(self):
+        self.aws_zone = None
         if self.provision.cloud == "aws":
             self.aws_zone = "{0}{1}".format(
                 self.provision.region, self.provision.zone_id)
@@ -168,13 +185,28 @@ class Settings(object):
             Static.msg("Default clusterfile remains as", self.settings.clusterfile)
         '''
 
+    def use_clusterfile(self, name):
+        # point this instance at another clusterfile, given as a path or a
+        # file in the app or user clusters folder. settings.yaml keeps its
+        # default (fleet mode).
+        for path in (name, os.path.join(self.folder_app_clusters, name), os.path.join(self.folder_user_clusters, name)):
+            if os.path.isfile(path):
+                self.settings = Struct(**dict(self.settings.__dict__, clusterfile=os.path.realpath(path)))
+                # parsed again on next use
+                for attribute in Settings.clusterfile_attributes:
+                    self.__dict__.pop(attribute, None)
+                return self.settings.clusterfile
+        Static.msg_bold("Clusterfile Not Found", name)
+        raise SystemExit(98)
+
     def load_clusterfile(self):
 
         clusterfile_data = None
         if os.path.isfile(self.settings.clusterfile):
-            clusterfile_data = yaml.load(open(self.settings.clusterfile), Loader=yamlordereddictloader.Loader)
+            clusterfile_data = YamlCache.load(self.settings.clusterfile, ordered=True)
         else:
             Static.msg_bold("Clusterfile not found", self.settings.clusterfile)
+            raise SystemExit(99)
 
         #if os.path.isfile(clusterfile_config_path):
         #    clusterfile_data = yaml.load(open(self.settings.clusterfile), Loader=yamlordereddictloader.Loader)
@@ -185,6 +217,8 @@ class Settings(object):
         self.cluster = Struct(**clusterfile_struct.cluster)
         self.provision = Struct(**clusterfile_struct.provision)
         self.elements = clusterfile_data['elements']
+        self.filters = clusterfile_data.get('filters') or []
+        self.set_zone()
 
 
         '''
@@ -193,10 +227,10 @@ class Settings(object):
         clusterfile_dst = os.path.join(sett.folder_config_clusters, args.init[1])
 
         if os.path.isfile(clusterfile_dst):
-            print "DESTINATION FILE {0} ALREADY EXISTS".format(clusterfile_dst)
+            Static.echo("DESTINATION FILE {0} ALREADY EXISTS".format(clusterfile_dst))
 
         if not os.path.isfile(clusterfile_src):
-            print "SOURCE FILE {0} NOT FOUND".format(clusterfile_src)
+            Static.echo("SOURCE FILE {0} NOT FOUND".format(clusterfile_src))
 
         Cmd.local_run_get_out("CREATED CLUSTERFILE {0}".format(clusterfile_src),
                               "cp {0} {1}".format(clusterfile_src, clusterfile_dst)
@@ -216,10 +250,10 @@ class Settings(object):
         clusterfile_dst = os.path.join(self.folder_user_clusters, self.args.init[1])
 
         if os.path.isfile(clusterfile_dst):
-            print "DESTINATION FILE {0} ALREADY EXISTS".format(clusterfile_dst)
+            Static.echo("DESTINATION FILE {0} ALREADY EXISTS".format(clusterfile_dst))
 
         if not os.path.isfile(clusterfile_src):
-            print "SOURCE FILE {0} NOT FOUND".format(clusterfile_src)
+            Static.echo("SOURCE FILE {0} NOT FOUND".format(clusterfile_src))
 
         Static.msg("Initializing New Clusterfile", clusterfile_dst)
 
@@ -249,6 +283,19 @@ class Settings(object):
         if not os.path.exists(self.folder_user_clusters):
             self.mkdir_p(self.folder_user_clusters)
 
+        self.folder_user_cache = os.path.join(self.folder_user, "cache")
+        if not os.path.exists(self.folder_user_cache):
+            self.mkdir_p(self.folder_user_cache)
+
+        YamlCache.folder = os.path.join(self.folder_user_cache, "yaml")
+        if not os.path.exists(YamlCache.folder):
+            self.mkdir_p(YamlCache.folder)
+
+        # templates here override the bundled ones with the same name
+        self.folder_user_templates = os.path.join(self.folder_user, "templates")
+        if not os.path.exists(self.folder_user_templates):
+            self.mkdir_p(self.folder_user_templates)
+
     def mkdir_p(self, path):
         try:
             os.makedirs(path)
@@ -261,22 +308,19 @@ class Settings(object):
     def set_app_folders(self):
         self.folder_app_templates = os.path.join(os.path.join(os.path.dirname(os.path.realpath(__file__)), "templates/"))
         self.folder_app_clusters = os.path.join(os.path.join(os.path.dirname(os.path.realpath(__file__)), "clusters/"))
+        self.folder_app_templates_compiled = os.path.join(os.path.dirname(os.path.realpath(__file__)), "templates_compiled")
 
     def load_settings_file(self):
         self.filepath_settings = os.path.join(self.folder_user, 'settings.yaml')
 
         if os.path.isfile(self.filepath_settings):
-            settings_raw = yaml.load(open(self.filepath_settings))
+            settings_raw = YamlCache.load(self.filepath_settings)
             settings_raw_struct = Struct(**settings_raw)
             self.settings = Struct(**settings_raw_struct.settings)
+            self.settings_saved = dict(self.settings.__dict__)
         else:
-            new_settings = """settings:
-    clusterfile: minikube.yaml
-"""
-
-            with open(self.filepath_settings, 'wb') as settings_file:
-                settings_file.write(new_settings)
-            self.load_settings_file()
+            self.settings = Struct(clusterfile="minikube.yaml")
+            self.save_settings_file()
 
     def save_settings_file(self):
 
@@ -286,11 +330,22 @@ class Settings(object):
         # self.config_locust.no_web = True
         # self.config_locust.run_time = '1m'
 
+        # unchanged settings are not written, so concurrent madcore runs
+        # don't race on the file
+        if self.settings.__dict__ == self.settings_saved:
+            return
+
         settings = dict()
         settings['settings'] = self.settings.__dict__
 
-        with open(self.filepath_settings, 'w') as settings_file:
+        # write and rename, readers see either the old or the new file
+        fd, tmp = tempfile.mkstemp(dir=self.folder_user, prefix=".settings-")
+        with os.fdopen(fd, 'w') as settings_file:
             settings_file.write(yaml.dump(settings, default_flow_style=False))
+        # mkstemp makes it 0600, keep the mode settings.yaml had
+        os.chmod(tmp, Static.file_mode(self.filepath_settings))
+        os.rename(tmp, self.filepath_settings)
+        self.settings_saved = dict(self.settings.__dict__)
 
     def get_populated_filename(self, name):
         return os.path.join(self.folder_user_populated, name)
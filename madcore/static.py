@@ -23,69 +23,66 @@ SOFTWARE.
 """
 
 import os
-import subprocess
-import datetime
-from termcolor import colored
+from tracer import Tracer
+from figlet import FigletFont
+from log import Log
+import log
 #import urllib3
 #import requests
 #import requests.exceptions
-import time
 
 
 class Static(object):
+    # read once at import, os.umask can only be read by setting it and that
+    # is not safe once threads create files
+    umask = os.umask(0o022)
+    os.umask(umask)
 
+    @staticmethod
+    def file_mode(path):
+        # mode of path, or what open() would create it with
+        try:
+            return os.stat(path).st_mode & 0o7777
+        except OSError:
+            return 0o666 & ~Static.umask
 
     @staticmethod
     def figlet(msg):
-        prov_cmd = "figlet -w 160 {0}".format(msg)
-        proc = subprocess.Popen(prov_cmd, stdout=subprocess.PIPE, shell=True, preexec_fn=os.setsid)
-        out = ''
-        for line in iter(proc.stdout.readline, ''):
-            out += line
-        print out
+        # only the cyber font is bundled, render it at the old -w 160
+        Static.banner(msg, 160)
 
     @staticmethod
     def figletcyber(msg):
-        prov_cmd = "figlet -f {0} {1}".format(os.path.join(os.path.dirname(os.path.realpath(__file__)), "cybermedium.flf"), msg)
-        proc = subprocess.Popen(prov_cmd, stdout=subprocess.PIPE, shell=True, preexec_fn=os.setsid)
-        out = ''
-        for line in iter(proc.stdout.readline, ''):
-            out += line
-        print out
+        Tracer.phase(msg)
+        Static.banner(msg, 80)
+
+    @staticmethod
+    def banner(msg, width):
+        # no ascii art in json, or when clusters run side by side
+        if Log.structured() or Log.label():
+            Log.phase(msg)
+        else:
+            Log.output(FigletFont.cyber().render(msg, width=width) + "\n")
 
     @staticmethod
     def msg(in_service, in_msg):
-        print colored(str(datetime.datetime.now()), 'cyan'), \
-            colored(':', 'white'), \
-            colored(in_service, 'yellow'), \
-            colored('>>', 'white'), \
-            colored(in_msg, 'green')
+        Log.event(log.INFO, in_service, in_msg)
 
     @staticmethod
     def msg_bold(in_service, in_msg):
-        print colored(str(datetime.datetime.now()), 'cyan'), \
-            colored(':', 'white'), \
-            colored(in_service, 'red'), \
-            colored('>>', 'white'), \
-            colored(in_msg, 'red', attrs=['bold'])
+        Log.event(log.ERROR, in_service, in_msg)
 
-    # TO BE EDITED
     @staticmethod
-    def wait_until_url_is_up(self, url, log_msg=None, verify=False, timeout=600, sleep_time=10):
-        elapsed_sec = 0
-        while True:
-            try:
-                response = requests.get(url, verify=verify, timeout=timeout)
-                response.raise_for_status()
-                return True
-            except Exception:
-                if log_msg:
-                    #self.logger.info(log_msg)
-                    pass
-                elapsed_sec += sleep_time
-                if elapsed_sec > timeout:
-                    break
-                time.sleep(sleep_time)
-
-        return False
+    def echo(text=""):
+        Log.output("{0}\n".format(text))
 
+    @staticmethod
+    def write(text, name=None):
+        Log.output(text, name)
+
+    @staticmethod
+    def wait_until_url_is_up(url, log_msg=None, verify=False, timeout=600):
+        from prober import Prober
+        if log_msg:
+            Static.msg(log_msg, url)
+        return Prober(deadline=timeout, verify=verify).wait(url).up
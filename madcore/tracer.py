@@ -0,0 +1,169 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+
+class Tracer(object):
+    # chrome trace / perfetto json, open with chrome://tracing or ui.perfetto.dev
+
+    path = None
+    origin = None
+    main_tid = None
+    events = []
+    # per thread stack of open phases: [name, frame, start]
+    phases = {}
+    lock = threading.RLock()
+
+    @staticmethod
+    def enable(path):
+        Tracer.path = path
+        Tracer.origin = time.time()
+        Tracer.main_tid = threading.current_thread().ident
+        atexit.register(Tracer.save)
+
+    @staticmethod
+    def now():
+        return int((time.time() - Tracer.origin) * 1000000)
+
+    @staticmethod
+    def add(event, tid=None):
+        event["pid"] = os.getpid()
+        event["tid"] = tid or threading.current_thread().ident
+        with Tracer.lock:
+            Tracer.events.append(event)
+
+    @staticmethod
+    def begin():
+        # returns the span start, None when tracing is off
+        if Tracer.path is None:
+            return None
+        tid = threading.current_thread().ident
+        Tracer.settle(tid, sys._getframe(1))
+        if tid != Tracer.main_tid:
+            # worker threads run on behalf of the main thread, make sure its
+            # finished phases don't swallow this span
+            frame = sys._current_frames().get(Tracer.main_tid)
+            if frame is not None:
+                Tracer.settle(Tracer.main_tid, frame)
+        return Tracer.now()
+
+    @staticmethod
+    def end(start, name, cmd, result):
+        if start is None:
+            return
+        if isinstance(cmd, list):
+            argv = cmd
+        else:
+            argv = ["/bin/sh", "-c", cmd]
+        Tracer.add({
+            "name": name,
+            "cat": "cmd",
+            "ph": "X",
+            "ts": start,
+            "dur": Tracer.now() - start,
+            "args": {
+                "argv": argv,
+                "exit_code": result.returncode,
+                "bytes": result.nbytes,
+                "peak_rss_kb": result.maxrss,
+            },
+        })
+
+    @staticmethod
+    def phase(name):
+        # a banner opens a phase owned by the function that printed it. the
+        # phase ends when that function returns or prints its next banner,
+        # so nested banners become nested spans.
+        if Tracer.path is None:
+            return
+        frame = sys._getframe(2)
+        with Tracer.lock:
+            stack = Tracer.settle(threading.current_thread().ident, frame)
+            while stack and stack[-1][1] is frame:
+                Tracer.close(stack.pop())
+            stack.append([name, frame, Tracer.now()])
+
+    @staticmethod
+    def settle(tid, frame):
+        # close phases whose owning function is no longer on the stack
+        alive = set()
+        f = frame
+        while f is not None:
+            alive.add(id(f))
+            f = f.f_back
+
+        with Tracer.lock:
+            stack = Tracer.phases.setdefault(tid, [])
+            while stack and id(stack[-1][1]) not in alive:
+                Tracer.close(stack.pop(), tid)
+            return stack
+
+    @staticmethod
+    def close(phase, tid=None):
+        name, frame, start = phase
+        Tracer.add({
+            "name": name,
+            "cat": "phase",
+            "ph": "X",
+            "ts": start,
+            "dur": Tracer.now() - start,
+        }, tid)
+
+    @staticmethod
+    def save():
+        if Tracer.path is None:
+            return
+
+        for tid, stack in Tracer.phases.items():
+            while stack:
+                Tracer.close(stack.pop(), tid)
+        Tracer.add({
+            "name": "madcore",
+            "cat": "main",
+            "ph": "X",
+            "ts": 0,
+            "dur": Tracer.now(),
+            "args": {"argv": sys.argv},
+        })
+
+        events = []
+        for tid in sorted(set(e["tid"] for e in Tracer.events)):
+            events.append({
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": {"name": "main" if tid == Tracer.main_tid else "worker-{0}".format(tid)},
+            })
+        events.extend(sorted(Tracer.events, key=lambda e: e["ts"]))
+
+        with open(Tracer.path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        Tracer.path = None
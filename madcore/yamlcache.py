@@ -0,0 +1,91 @@
+"""
+MIT License
+
+Copyright (c) 2016-2018 Madcore Ltd
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import cPickle
+import hashlib
+import os
+import tempfile
+import yaml
+import yamlordereddictloader
+
+
+# libyaml parser when pyyaml was built with it, pure python otherwise
+BaseLoader = getattr(yaml, "CLoader", yaml.Loader)
+
+
+class OrderedLoader(BaseLoader):
+    # yamlordereddictloader.Loader on top of the C parser
+    construct_mapping = yamlordereddictloader.construct_mapping
+
+OrderedLoader.add_constructor('tag:yaml.org,2002:map', yamlordereddictloader.construct_yaml_map)
+OrderedLoader.add_constructor('tag:yaml.org,2002:omap', yamlordereddictloader.construct_yaml_map)
+
+
+class YamlCache(object):
+    # parsed yaml files pickled under ~/.madcore/cache/yaml, reused while
+    # the file keeps the same path, mtime and size
+
+    folder = None
+
+    @staticmethod
+    def load(path, ordered=False):
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        stamp = (path, stat.st_mtime, stat.st_size, ordered)
+
+        cache_path = YamlCache.cache_path(path, ordered)
+        if cache_path and os.path.isfile(cache_path):
+            try:
+                with open(cache_path, "rb") as f:
+                    cached_stamp, data = cPickle.load(f)
+                if cached_stamp == stamp:
+                    return data
+            except Exception:
+                # unreadable or from another version, parse again
+                pass
+
+        with open(path) as f:
+            data = yaml.load(f, Loader=OrderedLoader if ordered else BaseLoader)
+
+        if cache_path:
+            YamlCache.store(cache_path, (stamp, data))
+        return data
+
+    @staticmethod
+    def cache_path(path, ordered):
+        if YamlCache.folder is None:
+            return None
+        key = hashlib.sha1("{0}:{1}".format(path, ordered)).hexdigest()
+        return os.path.join(YamlCache.folder, key + ".pickle")
+
+    @staticmethod
+    def store(cache_path, entry):
+        try:
+            fd, tmp = tempfile.mkstemp(dir=YamlCache.folder, prefix=".yaml-")
+            with os.fdopen(fd, "wb") as f:
+                cPickle.dump(entry, f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, cache_path)
+        except (IOError, OSError, cPickle.PicklingError):
+            # the cache is only an optimization
+            pass
@@ -1,11 +1,13 @@
 #!/usr/bin/env python
 from __future__ import unicode_literals, print_function
 from subprocess import check_output
-from setuptools import setup, find_packages
+from setuptools import setup, find_packages, Command
 from setuptools.dist import Distribution
+from setuptools.command.build_py import build_py
 #from madcore.cmd import Cmd
 import subprocess
 import sys
+import os
 import pkg_resources
 
 
@@ -43,6 +45,48 @@ def get_semantic_version():
         return v
 
 
+def compile_templates(package_dir):
+    # jinja templates only change at release time, compile them to python
+    # modules once here instead of parsing them on every fresh machine
+    try:
+        from jinja2 import Environment, FileSystemLoader
+    except ImportError:
+        sys.stdout.write("jinja2 not available, skipping template precompilation\n")
+        return
+
+    source = os.path.join('madcore', 'templates')
+    target = os.path.join(package_dir, 'madcore', 'templates_compiled')
+    if not os.path.isdir(target):
+        os.makedirs(target)
+
+    env = Environment(loader=FileSystemLoader(source))
+    env.compile_templates(target, zip=None, ignore_errors=False,
+                          py_compile=sys.version_info[0] == 2,
+                          log_function=lambda msg: sys.stdout.write(msg + '\n'))
+
+
+class build_templates(Command):
+    description = 'precompile madcore/templates into madcore/templates_compiled'
+    user_options = [(str('build-lib='), str('b'), str('directory to build into (default: in place)'))]
+
+    def initialize_options(self):
+        self.build_lib = None
+
+    def finalize_options(self):
+        pass
+
+    def run(self):
+        compile_templates(self.build_lib or '.')
+
+
+class build_py_templates(build_py):
+
+    def run(self):
+        build_py.run(self)
+        if not self.dry_run:
+            compile_templates(self.build_lib)
+
+
 VERSION = get_semantic_version()
 PROJECT = 'madcore'
 
@@ -102,6 +146,11 @@ setup(
     #distclass=BinaryDistribution,
     zip_safe=False,
 
+    cmdclass={
+        'build_py': build_py_templates,
+        'build_templates': build_templates,
+    },
+
     entry_points={
         'console_scripts': [
             'madcore = madcore.madcore:main'